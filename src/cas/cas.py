@@ -26,8 +26,12 @@ def hash_file(filepath, chunk_size=65536):
 def save_index(storage_dir, index_data):
     """Save the index data to cas_index.json"""
     index_path = os.path.join(storage_dir, "cas_index.json")
-    with open(index_path, "w") as f:
+    # write a temp file and rename it over the index, so a server reading
+    # the index never sees a half-written file
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(index_data, f, indent=2)
+    os.replace(tmp_path, index_path)
 
 
 def load_index(storage_dir):
@@ -43,6 +47,11 @@ def load_index(storage_dir):
 
 
 def store_file(path, storage_dir, chunk_size=65536):
+    return store_file_entry(path, storage_dir, chunk_size)[0]
+
+
+def store_file_entry(path, storage_dir, chunk_size=65536):
+    """Store a file like store_file, returning (file_hash, index entry)"""
     h, chunk_hashes, chunks_data = hash_file(path, chunk_size)
 
     os.makedirs(storage_dir, exist_ok=True)
@@ -73,10 +82,9 @@ def store_file(path, storage_dir, chunk_size=65536):
                 parity[i] ^= padded_chunk[i]
         parity_chunks.append(bytes(parity))
 
-    # saving data chunks
+    # saving data chunks (hash_file already hashed each one)
     data_chunk_hashes = []
-    for chunk in data_chunks:
-        ch = hashlib.sha256(chunk).hexdigest()
+    for ch, chunk in chunks_data:
         data_chunk_hashes.append(ch)
 
         chunk_path = os.path.join(storage_dir, ch)
@@ -125,7 +133,7 @@ def store_file(path, storage_dir, chunk_size=65536):
     save_index(storage_dir, index)
     print(f"✓ Metadata saved to {storage_dir}/cas_index.json")
 
-    return h
+    return h, index[h]
 
 
 
@@ -7,9 +7,9 @@ Provides methods for bootstrapping, storing, and retrieving values.
 
 import asyncio
 import logging
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from .node import Node, generate_node_id, xor_distance
+from .node import Node, generate_node_id, xor_distance, bytes_to_int
 from .routing_table import RoutingTable, K
 from .network import create_protocol, KademliaProtocol
 from .rpc import RPCHandler, RPCType, create_rpc_request
@@ -21,6 +21,7 @@ logger = logging.getLogger(__name__)
 # Kademlia parameters
 ALPHA = 3  # Number of parallel lookups
 REPUBLISH_INTERVAL = 3600  # Republish values every hour
+FIND_VALUES_BATCH = 64  # Max keys per FIND_VALUES request (keeps replies in one datagram)
 
 
 class KademliaNode:
@@ -85,6 +86,7 @@ class KademliaNode:
             self.local_node,
             self.rpc_handler.handle_request
         )
+        self.rpc_handler.start_ingest()
         
         self._running = True
         logger.info(f"Kademlia node started: {self.local_node}")
@@ -97,6 +99,7 @@ class KademliaNode:
         self._running = False
         if self.transport:
             self.transport.close()
+        await self.rpc_handler.stop_ingest()
         
         logger.info(f"Kademlia node stopped: {self.local_node}")
     
@@ -208,6 +211,59 @@ class KademliaNode:
         result = await self.iterative_find_value(key_hash)
         return result
     
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        Retrieve several values with batched FIND_VALUES requests.
+        
+        Each key is asked of the closest node we know for it, and keys
+        sharing that node go out together, so a whole file's chunks cost
+        about one round trip per node. This is best-effort: keys the node
+        doesn't hold, or nodes that don't understand FIND_VALUES, are left
+        out of the result and can be retried with get().
+        
+        Args:
+            keys: Keys to lookup (will be hashed)
+        
+        Returns:
+            Dict mapping key -> value for the keys that were found
+        """
+        results: Dict[str, Any] = {}
+        by_node: Dict[bytes, Tuple[Node, Dict[str, str]]] = {}  # node_id -> (node, key_hex -> key)
+        
+        for key in keys:
+            key_hash = generate_node_id(key)
+            key_hex = key_hash.hex()
+            
+            # Check local storage first
+            if key_hex in self.storage:
+                results[key] = self.storage[key_hex]['value']
+                continue
+            
+            closest = self.routing_table.get_closest_nodes(key_hash, count=1)
+            if closest:
+                node = closest[0]
+                by_node.setdefault(node.node_id, (node, {}))[1][key_hex] = key
+        
+        requests = []
+        for node, wanted in by_node.values():
+            key_hexes = list(wanted)
+            for i in range(0, len(key_hexes), FIND_VALUES_BATCH):
+                batch = key_hexes[i:i + FIND_VALUES_BATCH]
+                requests.append((node, wanted, self._find_values(node, batch)))
+        
+        replies = await asyncio.gather(*(r[2] for r in requests), return_exceptions=True)
+        
+        for (node, wanted, _), values in zip(requests, replies):
+            if isinstance(values, Exception) or not values:
+                continue
+            for key_hex, value in values.items():
+                if key_hex in wanted:
+                    # Cache locally
+                    self.storage[key_hex] = {'value': value, 'stored_by': node.to_dict()}
+                    results[wanted[key_hex]] = value
+        
+        return results
+    
     async def iterative_find_node(self, target_id: bytes) -> List[Node]:
         """
         Perform iterative node lookup.
@@ -231,6 +287,7 @@ class KademliaNode:
             return []
         
         # Track queried nodes and their distances
+        target_int = bytes_to_int(target_id)
         queried: Set[bytes] = set()
         found_nodes: Dict[bytes, Node] = {n.node_id: n for n in closest}
         
@@ -240,7 +297,7 @@ class KademliaNode:
                 n for n in found_nodes.values()
                 if n.node_id not in queried
             ]
-            unqueried.sort(key=lambda n: xor_distance(n.node_id, target_id))
+            unqueried.sort(key=lambda n: n.node_id_int ^ target_int)
             
             if not unqueried:
                 break
@@ -277,7 +334,7 @@ class KademliaNode:
         
         # Return k closest
         all_nodes = list(found_nodes.values())
-        all_nodes.sort(key=lambda n: xor_distance(n.node_id, target_id))
+        all_nodes.sort(key=lambda n: n.node_id_int ^ target_int)
         return all_nodes[:self.k]
     
     async def iterative_find_value(self, key_hash: bytes) -> Optional[Any]:
@@ -300,6 +357,7 @@ class KademliaNode:
         if not closest:
             return None
         
+        key_int = bytes_to_int(key_hash)
         queried: Set[bytes] = set()
         found_nodes: Dict[bytes, Node] = {n.node_id: n for n in closest}
         
@@ -308,33 +366,46 @@ class KademliaNode:
                 n for n in found_nodes.values()
                 if n.node_id not in queried
             ]
-            unqueried.sort(key=lambda n: xor_distance(n.node_id, key_hash))
+            unqueried.sort(key=lambda n: n.node_id_int ^ key_int)
             
             if not unqueried:
                 break
             
             to_query = unqueried[:self.alpha]
-            
             for node in to_query:
                 queried.add(node.node_id)
-                
-                result = await self._find_value(node, key_hex)
-                if result is None:
-                    continue
-                
-                # Check if we got the value
-                if result.get('found'):
-                    value = result.get('value')
-                    # Cache locally
-                    self.storage[key_hex] = {'value': value, 'stored_by': node.to_dict()}
-                    return value
-                
-                # Otherwise, add returned nodes
-                for node_data in result.get('nodes', []):
-                    new_node = Node.from_dict(node_data)
-                    if new_node.node_id not in found_nodes and new_node.node_id != self.local_node.node_id:
-                        found_nodes[new_node.node_id] = new_node
-                        self.routing_table.add_node(new_node)
+            
+            # Query alpha nodes in parallel, handling replies as they arrive
+            tasks = [
+                asyncio.ensure_future(self._find_value_from(node, key_hex))
+                for node in to_query
+            ]
+            try:
+                for next_reply in asyncio.as_completed(tasks):
+                    try:
+                        node, result = await next_reply
+                    except Exception:
+                        continue
+                    if result is None:
+                        continue
+                    
+                    # Check if we got the value
+                    if result.get('found'):
+                        value = result.get('value')
+                        # Cache locally
+                        self.storage[key_hex] = {'value': value, 'stored_by': node.to_dict()}
+                        return value
+                    
+                    # Otherwise, add returned nodes
+                    for node_data in result.get('nodes', []):
+                        new_node = Node.from_dict(node_data)
+                        if new_node.node_id not in found_nodes and new_node.node_id != self.local_node.node_id:
+                            found_nodes[new_node.node_id] = new_node
+                            self.routing_table.add_node(new_node)
+            finally:
+                # Stop outstanding queries once the value is found
+                for task in tasks:
+                    task.cancel()
         
         return None
     
@@ -396,6 +467,25 @@ class KademliaNode:
         
         return response.get('payload', {})
     
+    async def _find_values(self, node: Node, keys: List[str]) -> Optional[Dict[str, Any]]:
+        """Send FIND_VALUES RPC to a node."""
+        if not self.protocol:
+            return None
+        
+        payload = create_rpc_request(RPCType.FIND_VALUES, keys=keys)
+        response = await self.protocol.send_request(node, RPCType.FIND_VALUES.value, payload)
+        
+        if response is None:
+            return None
+        
+        # Nodes without FIND_VALUES answer with an error and no values
+        values = response.get('payload', {}).get('values')
+        return values if isinstance(values, dict) else None
+    
+    async def _find_value_from(self, node: Node, key: str) -> Tuple[Node, Optional[dict]]:
+        """FIND_VALUE RPC tagged with the node it was sent to."""
+        return node, await self._find_value(node, key)
+    
     def debug_status(self) -> str:
         """Return debug information about the node."""
         lines = [
@@ -61,6 +61,11 @@ def xor_distance(id1: bytes, id2: bytes) -> int:
     return bytes_to_int(id1) ^ bytes_to_int(id2)
 
 
+def xor_distance_int(id1: int, id2: int) -> int:
+    """XOR distance between two node IDs already decoded to integers."""
+    return id1 ^ id2
+
+
 def get_prefix_length(distance: int) -> int:
     """
     Get the number of shared prefix bits between two IDs.
@@ -90,24 +95,28 @@ class Node:
         ip: IP address of the node
         port: UDP port the node listens on
         last_seen: Timestamp of last contact with this node
+        node_id_int: node_id decoded as a big-endian integer (cached)
     """
     node_id: bytes
     ip: str
     port: int
     last_seen: float = field(default_factory=time.time)
+    node_id_int: int = field(init=False, repr=False, compare=False)
+    _dict_cache: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
     
     def __post_init__(self):
-        """Validate node ID length."""
+        """Validate node ID length and cache its integer form."""
         if len(self.node_id) != ID_BYTES:
             raise ValueError(f"Node ID must be {ID_BYTES} bytes, got {len(self.node_id)}")
+        self.node_id_int = bytes_to_int(self.node_id)
     
     def distance_to(self, other: 'Node') -> int:
         """Calculate XOR distance to another node."""
-        return xor_distance(self.node_id, other.node_id)
+        return self.node_id_int ^ other.node_id_int
     
     def distance_to_id(self, target_id: bytes) -> int:
         """Calculate XOR distance to a target ID."""
-        return xor_distance(self.node_id, target_id)
+        return self.node_id_int ^ bytes_to_int(target_id)
     
     def prefix_length_to(self, other: 'Node') -> int:
         """Get shared prefix length with another node."""
@@ -133,12 +142,20 @@ class Node:
         return (self.ip, self.port)
     
     def to_dict(self) -> dict:
-        """Serialize node to dictionary for network transport."""
-        return {
-            'node_id': self.node_id.hex(),
-            'ip': self.ip,
-            'port': self.port
-        }
+        """
+        Serialize node to dictionary for network transport.
+        
+        The dict is built once and shared between callers (it holds no
+        timestamp, and a node's ID and address don't change), so treat
+        it as read-only.
+        """
+        if self._dict_cache is None:
+            self._dict_cache = {
+                'node_id': self.node_id.hex(),
+                'ip': self.ip,
+                'port': self.port
+            }
+        return self._dict_cache
     
     @classmethod
     def from_dict(cls, data: dict) -> 'Node':
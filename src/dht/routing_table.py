@@ -5,10 +5,12 @@ The routing table uses k-buckets to organize known nodes by XOR distance.
 Each bucket holds up to k nodes, and there are 160 buckets (one per bit position).
 """
 
+import heapq
 import threading
 import time
-from typing import List, Optional
-from .node import Node, xor_distance, get_prefix_length, ID_BITS
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from .node import Node, xor_distance, xor_distance_int, get_prefix_length, bytes_to_int, ID_BITS
 
 
 # Kademlia parameters
@@ -28,10 +30,11 @@ class KBucket:
     
     def __init__(self, k: int = K):
         self.k = k
-        self.nodes: List[Node] = []
-        self.replacement_cache: List[Node] = []  # Nodes waiting for a spot
+        # Keyed by node_id; insertion order doubles as last-seen order
+        self.nodes: 'OrderedDict[bytes, Node]' = OrderedDict()
+        self.replacement_cache: 'OrderedDict[bytes, Node]' = OrderedDict()  # Nodes waiting for a spot
         self.last_updated = time.time()
-        self._lock = threading.RLock()
+        self._lock = threading.Lock()
     
     def add(self, node: Node) -> Optional[Node]:
         """
@@ -46,28 +49,43 @@ class KBucket:
         """
         with self._lock:
             # If node already exists, move it to the end (most recently seen)
-            for i, existing in enumerate(self.nodes):
-                if existing.node_id == node.node_id:
-                    existing.update_last_seen()
-                    # Move to end
-                    self.nodes.append(self.nodes.pop(i))
-                    self.last_updated = time.time()
-                    return None
+            if self._touch_locked(node.node_id):
+                return None
             
             # If bucket has space, add the node
             if len(self.nodes) < self.k:
-                self.nodes.append(node)
+                self.nodes[node.node_id] = node
                 self.last_updated = time.time()
                 return None
             
             # Bucket is full - add to replacement cache and return oldest
-            if node not in self.replacement_cache:
-                self.replacement_cache.append(node)
+            if node.node_id not in self.replacement_cache:
+                self.replacement_cache[node.node_id] = node
                 # Keep replacement cache bounded
                 if len(self.replacement_cache) > self.k:
-                    self.replacement_cache.pop(0)
+                    self.replacement_cache.popitem(last=False)
             
-            return self.nodes[0]  # Return oldest for ping check
+            return next(iter(self.nodes.values()))  # Return oldest for ping check
+    
+    def touch(self, node: Node) -> bool:
+        """
+        Mark a node already in the bucket as most recently seen.
+        
+        Returns:
+            True if the node was in the bucket, False otherwise
+        """
+        with self._lock:
+            return self._touch_locked(node.node_id)
+    
+    def _touch_locked(self, node_id: bytes) -> bool:
+        """touch() body; caller must hold self._lock."""
+        existing = self.nodes.get(node_id)
+        if existing is None:
+            return False
+        existing.update_last_seen()
+        self.nodes.move_to_end(node_id)
+        self.last_updated = time.time()
+        return True
     
     def remove(self, node: Node) -> bool:
         """
@@ -79,25 +97,24 @@ class KBucket:
             True if node was found and removed
         """
         with self._lock:
-            for i, existing in enumerate(self.nodes):
-                if existing.node_id == node.node_id:
-                    self.nodes.pop(i)
-                    # Promote from replacement cache if available
-                    if self.replacement_cache:
-                        self.nodes.append(self.replacement_cache.pop(0))
-                    self.last_updated = time.time()
-                    return True
-            return False
+            if self.nodes.pop(node.node_id, None) is None:
+                return False
+            # Promote from replacement cache if available
+            if self.replacement_cache:
+                promoted_id, promoted = self.replacement_cache.popitem(last=False)
+                self.nodes[promoted_id] = promoted
+            self.last_updated = time.time()
+            return True
     
     def get_nodes(self) -> List[Node]:
         """Get a copy of all nodes in the bucket."""
         with self._lock:
-            return list(self.nodes)
+            return list(self.nodes.values())
     
     def contains(self, node: Node) -> bool:
         """Check if node is in this bucket."""
         with self._lock:
-            return any(n.node_id == node.node_id for n in self.nodes)
+            return node.node_id in self.nodes
     
     def __len__(self) -> int:
         return len(self.nodes)
@@ -121,9 +138,24 @@ class RoutingTable:
     
     def __init__(self, local_node: Node, k: int = K):
         self.local_node = local_node
+        self.local_node_int = local_node.node_id_int
         self.k = k
         self.buckets: List[KBucket] = [KBucket(k) for _ in range(ID_BITS)]
-        self._lock = threading.RLock()
+        # node_id -> index of the bucket holding it; a hint for the known-peer
+        # fast path (nodes promoted from a replacement cache are indexed on
+        # next sight)
+        self._index: Dict[bytes, int] = {}
+        # (last_updated, bucket_idx) min-heap with at most one entry per
+        # bucket; entries are re-stamped lazily when popped
+        self._refresh_heap: List[Tuple[float, int]] = []
+        self._in_heap: Set[int] = set()
+        # Flat struct-of-arrays view of every bucketed node, kept dense by
+        # swap-with-last on removal, so lookups scan two lists instead of
+        # walking 160 buckets
+        self._id_ints: List[int] = []
+        self._refs: List[Node] = []
+        self._pos: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
     
     def get_bucket_index(self, node_id: bytes) -> int:
         """
@@ -131,7 +163,11 @@ class RoutingTable:
         
         The bucket index is based on the XOR distance prefix length.
         """
-        distance = xor_distance(self.local_node.node_id, node_id)
+        return self._bucket_index_int(bytes_to_int(node_id))
+    
+    def _bucket_index_int(self, node_id_int: int) -> int:
+        """Bucket index for a node ID already decoded to an integer."""
+        distance = xor_distance_int(self.local_node_int, node_id_int)
         if distance == 0:
             return 0  # Same node as us
         # Bucket index is 159 - number of leading zeros
@@ -152,15 +188,63 @@ class RoutingTable:
         if node.node_id == self.local_node.node_id:
             return None
         
-        bucket_idx = self.get_bucket_index(node.node_id)
-        return self.buckets[bucket_idx].add(node)
+        # Fast path: already known, just refresh it
+        bucket_idx = self._index.get(node.node_id)
+        if bucket_idx is not None and self.buckets[bucket_idx].touch(node):
+            return None
+        
+        bucket_idx = self._bucket_index_int(node.node_id_int)
+        bucket = self.buckets[bucket_idx]
+        with self._lock:
+            oldest = bucket.add(node)
+            if oldest is None:
+                self._index[node.node_id] = bucket_idx
+                if node.node_id not in self._pos:
+                    self._track(node)
+                if bucket_idx not in self._in_heap:
+                    heapq.heappush(self._refresh_heap, (bucket.last_updated, bucket_idx))
+                    self._in_heap.add(bucket_idx)
+        return oldest
     
     def remove_node(self, node: Node) -> bool:
         """Remove a node from the routing table."""
-        bucket_idx = self.get_bucket_index(node.node_id)
-        return self.buckets[bucket_idx].remove(node)
+        self._index.pop(node.node_id, None)
+        bucket_idx = self._bucket_index_int(node.node_id_int)
+        bucket = self.buckets[bucket_idx]
+        with self._lock:
+            removed = bucket.remove(node)
+            if removed:
+                self._untrack(node.node_id)
+                # Pick up a node promoted from the replacement cache
+                for n in bucket.get_nodes():
+                    if n.node_id not in self._pos:
+                        self._track(n)
+        return removed
+    
+    def _track(self, node: Node):
+        """Append a node to the flat arrays; caller must hold self._lock."""
+        self._pos[node.node_id] = len(self._refs)
+        self._id_ints.append(node.node_id_int)
+        self._refs.append(node)
     
-    def get_closest_nodes(self, target_id: bytes, count: int = K) -> List[Node]:
+    def _untrack(self, node_id: bytes):
+        """Drop a node from the flat arrays; caller must hold self._lock."""
+        i = self._pos.pop(node_id, None)
+        if i is None:
+            return
+        last_ref = self._refs.pop()
+        last_int = self._id_ints.pop()
+        if i < len(self._refs):
+            self._refs[i] = last_ref
+            self._id_ints[i] = last_int
+            self._pos[last_ref.node_id] = i
+    
+    def get_closest_nodes(
+        self,
+        target_id: bytes,
+        count: int = K,
+        exclude_id: Optional[bytes] = None
+    ) -> List[Node]:
         """
         Get the k closest nodes to a target ID.
         
@@ -170,41 +254,71 @@ class RoutingTable:
         Args:
             target_id: The target node ID to find closest nodes to
             count: Maximum number of nodes to return
+            exclude_id: Optional node ID to leave out (e.g. the requester)
         
         Returns:
             List of nodes sorted by XOR distance to target
         """
-        all_nodes = []
-        with self._lock:
-            for bucket in self.buckets:
-                all_nodes.extend(bucket.get_nodes())
+        return self.get_closest_nodes_int(bytes_to_int(target_id), count, exclude_id)
+    
+    def get_closest_nodes_int(
+        self,
+        target_int: int,
+        count: int = K,
+        exclude_id: Optional[bytes] = None
+    ) -> List[Node]:
+        """
+        Same as get_closest_nodes, for a target ID already decoded to an int.
+        
+        RPC handlers parse hex targets straight to an int and call this
+        to skip the intermediate bytes object.
+        """
+        # Ask for one extra so dropping the excluded node still leaves
+        # `count` results
+        want = count + 1 if exclude_id is not None else count
         
-        # Sort by XOR distance to target
-        all_nodes.sort(key=lambda n: xor_distance(n.node_id, target_id))
+        # Partial sort by XOR distance to target; distances are unique per
+        # node ID so the tuples never fall through to comparing Nodes
+        with self._lock:
+            closest = heapq.nsmallest(
+                want, zip(map(target_int.__xor__, self._id_ints), self._refs)
+            )
         
-        return all_nodes[:count]
+        nodes = [n for _, n in closest]
+        if exclude_id is not None:
+            nodes = [n for n in nodes if n.node_id != exclude_id][:count]
+        return nodes
     
     def get_all_nodes(self) -> List[Node]:
         """Get all nodes in the routing table."""
-        all_nodes = []
         with self._lock:
-            for bucket in self.buckets:
-                all_nodes.extend(bucket.get_nodes())
-        return all_nodes
+            return list(self._refs)
     
     def get_bucket_for_node(self, node: Node) -> KBucket:
         """Get the bucket that a node belongs to."""
-        bucket_idx = self.get_bucket_index(node.node_id)
+        bucket_idx = self._bucket_index_int(node.node_id_int)
         return self.buckets[bucket_idx]
     
     def get_stale_buckets(self) -> List[int]:
         """Get indices of buckets that haven't been updated recently."""
         stale = []
-        now = time.time()
-        for i, bucket in enumerate(self.buckets):
-            if len(bucket) > 0 and (now - bucket.last_updated) > BUCKET_REFRESH_INTERVAL:
-                stale.append(i)
-        return stale
+        cutoff = time.time() - BUCKET_REFRESH_INTERVAL
+        with self._lock:
+            heap = self._refresh_heap
+            while heap and heap[0][0] < cutoff:
+                stamp, i = heapq.heappop(heap)
+                bucket = self.buckets[i]
+                if len(bucket) == 0:
+                    self._in_heap.discard(i)
+                elif bucket.last_updated != stamp:
+                    # Touched since it was pushed; re-queue at its real time
+                    heapq.heappush(heap, (bucket.last_updated, i))
+                else:
+                    stale.append(i)
+            # Still stale until refreshed, so keep them queued
+            for i in stale:
+                heapq.heappush(heap, (self.buckets[i].last_updated, i))
+        return sorted(stale)
     
     def total_nodes(self) -> int:
         """Get total number of nodes in routing table."""
@@ -222,6 +336,6 @@ class RoutingTable:
             if len(bucket) > 0:
                 print(f"  Bucket {i}: {bucket}")
                 for node in bucket.get_nodes():
-                    dist = xor_distance(self.local_node.node_id, node.node_id)
+                    dist = xor_distance_int(self.local_node_int, node.node_id_int)
                     print(f"    - {node} (distance: {dist})")
         print("=" * 50)
@@ -6,21 +6,46 @@ Defines the four core Kademlia RPCs:
 - STORE: Store a key-value pair
 - FIND_NODE: Find k closest nodes to a target ID
 - FIND_VALUE: Find value for key, or k closest nodes
+
+plus FIND_VALUES, a batched FIND_VALUE that returns only the values held
+locally (no node lists), so many keys cost one round trip.
 """
 
+import asyncio
+import re
 from enum import Enum
 from typing import Any, Dict, List, Optional
 
-from .node import Node
+from .node import Node, ID_BYTES
 from .routing_table import RoutingTable, K
 
 
+# Max senders folded into one routing-table update pass
+INGEST_BATCH_SIZE = 64
+
+# Most keys one FIND_VALUES request may ask for; kademlia sends batches of
+# FIND_VALUES_BATCH (64), so this only turns away oversized requests
+MAX_FIND_VALUES_KEYS = 256
+
+# A node ID or key in hex; int(..., 16) alone would also take other
+# lengths, signs, "0x" prefixes, underscores and whitespace
+_ID_HEX = re.compile(r"[0-9a-fA-F]{%d}" % (ID_BYTES * 2))
+
+
+def _parse_id_hex(value: Any) -> Optional[int]:
+    """Decode a hex node ID or key to an int, or None if it is malformed."""
+    if not isinstance(value, str) or not _ID_HEX.fullmatch(value):
+        return None
+    return int(value, 16)
+
+
 class RPCType(Enum):
     """Kademlia RPC types."""
     PING = "PING"
     STORE = "STORE"
     FIND_NODE = "FIND_NODE"
     FIND_VALUE = "FIND_VALUE"
+    FIND_VALUES = "FIND_VALUES"
 
 
 class RPCHandler:
@@ -38,6 +63,51 @@ class RPCHandler:
         """
         self.routing_table = routing_table
         self.storage = storage
+        
+        # Senders waiting to be added to the routing table (see start_ingest)
+        self._ingest_q: Optional[asyncio.Queue] = None
+        self._ingest_task: Optional[asyncio.Task] = None
+    
+    def start_ingest(self):
+        """
+        Move routing-table updates for RPC senders onto a background task.
+        
+        Handlers then only enqueue the sender, and repeated messages from
+        the same peer are collapsed into one add_node call per batch.
+        Without this, senders are added synchronously.
+        """
+        if self._ingest_task is not None:
+            return
+        self._ingest_q = asyncio.Queue()
+        self._ingest_task = asyncio.create_task(self._drain_ingest())
+    
+    async def stop_ingest(self):
+        """Stop the background task and apply any queued senders."""
+        if self._ingest_task is None:
+            return
+        self._ingest_task.cancel()
+        try:
+            await self._ingest_task
+        except asyncio.CancelledError:
+            pass
+        
+        while not self._ingest_q.empty():
+            self.routing_table.add_node(self._ingest_q.get_nowait())
+        self._ingest_q = None
+        self._ingest_task = None
+    
+    async def _drain_ingest(self):
+        """Apply queued senders to the routing table in deduplicated batches."""
+        queue = self._ingest_q
+        while True:
+            sender = await queue.get()
+            batch = {sender.node_id: sender}
+            while len(batch) < INGEST_BATCH_SIZE and not queue.empty():
+                sender = queue.get_nowait()
+                batch[sender.node_id] = sender
+            
+            for node in batch.values():
+                self.routing_table.add_node(node)
     
     async def handle_request(
         self, 
@@ -59,7 +129,10 @@ class RPCHandler:
             Response payload dict
         """
         # Update routing table with sender (they're alive!)
-        self.routing_table.add_node(sender)
+        if self._ingest_q is not None:
+            self._ingest_q.put_nowait(sender)
+        else:
+            self.routing_table.add_node(sender)
         
         # Route to appropriate handler
         if rpc == RPCType.PING.value:
@@ -70,6 +143,8 @@ class RPCHandler:
             return self._handle_find_node(sender, payload)
         elif rpc == RPCType.FIND_VALUE.value:
             return self._handle_find_value(sender, payload)
+        elif rpc == RPCType.FIND_VALUES.value:
+            return self._handle_find_values(sender, payload)
         else:
             return {"error": f"Unknown RPC: {rpc}"}
     
@@ -117,16 +192,14 @@ class RPCHandler:
         if not target_hex:
             return {"error": "Missing target"}
         
-        try:
-            target_id = bytes.fromhex(target_hex)
-        except ValueError:
+        target_int = _parse_id_hex(target_hex)
+        if target_int is None:
             return {"error": "Invalid target ID"}
         
-        # Get k closest nodes
-        closest = self.routing_table.get_closest_nodes(target_id, count=K)
-        
-        # Don't include the requester in the response
-        closest = [n for n in closest if n.node_id != sender.node_id]
+        # Get k closest nodes, not including the requester
+        closest = self.routing_table.get_closest_nodes_int(
+            target_int, count=K, exclude_id=sender.node_id
+        )
         
         return {
             "nodes": [node.to_dict() for node in closest]
@@ -154,18 +227,42 @@ class RPCHandler:
             }
         
         # We don't have it - return closest nodes
-        try:
-            target_id = bytes.fromhex(key)
-        except ValueError:
+        target_int = _parse_id_hex(key)
+        if target_int is None:
             return {"error": "Invalid key format"}
         
-        closest = self.routing_table.get_closest_nodes(target_id, count=K)
-        closest = [n for n in closest if n.node_id != sender.node_id]
+        closest = self.routing_table.get_closest_nodes_int(
+            target_int, count=K, exclude_id=sender.node_id
+        )
         
         return {
             "found": False,
             "nodes": [node.to_dict() for node in closest]
         }
+    
+    def _handle_find_values(self, sender: Node, payload: dict) -> dict:
+        """
+        Handle FIND_VALUES request.
+        
+        Return the values we hold for any of the requested keys. Keys we
+        don't have are simply left out.
+        
+        Expected payload:
+            keys: list of hex key strings, at most MAX_FIND_VALUES_KEYS
+        """
+        keys = payload.get('keys')
+        if not isinstance(keys, list):
+            return {"error": "Missing keys"}
+        if len(keys) > MAX_FIND_VALUES_KEYS:
+            return {"error": "Too many keys"}
+        # A list or dict item isn't hashable and would fail the lookup below
+        if not all(isinstance(key, str) for key in keys):
+            return {"error": "Invalid key format"}
+        
+        storage = self.storage
+        return {
+            "values": {key: storage[key]['value'] for key in keys if key in storage}
+        }
 
 
 def create_rpc_request(rpc_type: RPCType, **kwargs) -> dict:
@@ -193,4 +290,9 @@ def create_rpc_request(rpc_type: RPCType, **kwargs) -> dict:
             'key': kwargs.get('key')
         }
     
+    elif rpc_type == RPCType.FIND_VALUES:
+        return {
+            'keys': kwargs.get('keys')
+        }
+    
     return {}
@@ -3,8 +3,32 @@ from cryptography.hazmat.primitives.asymmetric import dh
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
+# RFC 3526 group 14 (2048-bit MODP), generator 2.
+# A fixed well-known group avoids a safe-prime search on every handshake.
+RFC3526_GROUP14_P = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD1"
+    "29024E088A67CC74020BBEA63B139B22514A08798E3404DD"
+    "EF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245"
+    "E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3D"
+    "C2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F"
+    "83655D23DCA3AD961C62F356208552BB9ED529077096966D"
+    "670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9"
+    "DE2BCBF6955817183995497CEA956AE515D2261898FA0510"
+    "15728E5A8AACAA68FFFFFFFFFFFFFFFF",
+    16,
+)
+_DH_PARAMETERS = None
+
+def get_dh_parameters():
+    global _DH_PARAMETERS
+    if _DH_PARAMETERS is None:
+        _DH_PARAMETERS = dh.DHParameterNumbers(p=RFC3526_GROUP14_P, g=2).parameters()
+    return _DH_PARAMETERS
 def generate_dh_parameters():
-    return dh.generate_parameters(generator=2, key_size=1024)
+    # kept for existing callers; returns the shared group instead of generating one
+    return get_dh_parameters()
 def generate_private_key(parameters):
     return parameters.generate_private_key()
 def generate_shared_key(private_key, peer_public_key):
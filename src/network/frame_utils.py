@@ -0,0 +1,85 @@
+# src/network/frame_utils.py
+"""
+Binary framing helpers.
+
+p2p_server <-> p2p_client use length-prefixed frames:
+    | u32 length (big-endian) | u8 opcode | payload[length - 1] |
+after a Diffie-Hellman handshake whose DH parameters and public keys are
+DER blocks:
+    | u16 length | DER bytes |
+
+P2PNode <-> P2PChunkDownloader use fixed-size structs for GET_CHUNK:
+    request:  | u8 GET_CHUNK_OPCODE | 32-byte raw SHA-256 |
+    response: | u8 status | u32 size | chunk bytes (status == CHUNK_OK only) |
+and GET_CHUNK_RANGE for a byte range of a chunk:
+    request:  | u8 GET_CHUNK_RANGE_OPCODE | 32-byte raw SHA-256 | u32 offset | u32 length |
+    response: | u8 status | u32 chunk size | u32 length | range bytes |
+Other P2PNode requests (LIST_FILES, GET_FILE_METADATA, ...) are
+newline-terminated JSON.
+"""
+import json
+import struct
+import zlib
+
+FRAME_HEADER = struct.Struct(">IB")
+
+OP_JSON = 1   # control message, payload is a UTF-8 JSON object
+OP_TEXT = 2   # free-form chat text
+OP_DATA = 3   # raw file bytes belonging to the current FILE_START
+OP_JSON_ZLIB = 4  # control message, payload is zlib-compressed UTF-8 JSON
+
+# JSON payloads smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+# Largest frame read_frame accepts (a DATA frame carries one whole chunk);
+# a bigger length prefix is a broken or hostile peer, not something to buffer
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+KEY_BLOCK_HEADER = struct.Struct(">H")
+
+CHUNK_REQUEST = struct.Struct(">B32s")
+CHUNK_RESPONSE = struct.Struct(">BI")
+GET_CHUNK_OPCODE = 0x01  # never a valid first byte of a JSON request line
+CHUNK_OK = 0
+CHUNK_MISSING = 1
+
+RANGE_REQUEST = struct.Struct(">B32sII")
+RANGE_RESPONSE = struct.Struct(">BII")
+GET_CHUNK_RANGE_OPCODE = 0x03
+
+# One shared encoder with no spaces after separators; json.dumps builds a
+# new encoder per call whenever options are passed
+_encode_compact_json = json.JSONEncoder(separators=(",", ":")).encode
+
+def encode_frame(opcode, payload):
+    return FRAME_HEADER.pack(len(payload) + 1, opcode) + payload
+def encode_json_frame(message, compress=False):
+    payload = _encode_compact_json(message).encode()
+    if compress and len(payload) >= COMPRESS_MIN_SIZE:
+        # level 1: most of the size win on repetitive JSON for little CPU
+        return encode_frame(OP_JSON_ZLIB, zlib.compress(payload, 1))
+    return encode_frame(OP_JSON, payload)
+def decode_json_payload(opcode, payload):
+    """Parse the payload of an OP_JSON or OP_JSON_ZLIB frame."""
+    if opcode == OP_JSON_ZLIB:
+        payload = zlib.decompress(payload)
+    return json.loads(payload)
+
+async def read_frame(reader):
+    """
+    Read one frame from an asyncio StreamReader. Raises IncompleteReadError
+    on EOF and ValueError if the length prefix is over MAX_FRAME_SIZE.
+    """
+    length, opcode = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds MAX_FRAME_SIZE")
+    payload = await reader.readexactly(length - 1) if length > 1 else b""
+    return opcode, payload
+
+def encode_key_block(der):
+    return KEY_BLOCK_HEADER.pack(len(der)) + der
+
+async def read_key_block(reader):
+    """Read one length-prefixed DER block of the handshake from an asyncio StreamReader."""
+    (length,) = KEY_BLOCK_HEADER.unpack(await reader.readexactly(KEY_BLOCK_HEADER.size))
+    return await reader.readexactly(length)
@@ -5,15 +5,39 @@ Similar to BitTorrent piece downloading strategy.
 """
 
 import asyncio
+import os
 import socket
 import hashlib
+import time
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import logging
+from src.network.frame_utils import (
+    CHUNK_OK, CHUNK_REQUEST, CHUNK_RESPONSE, GET_CHUNK_OPCODE,
+    GET_CHUNK_RANGE_OPCODE, MAX_FRAME_SIZE, RANGE_REQUEST, RANGE_RESPONSE
+)
 
 logger = logging.getLogger(__name__)
 
+PIPELINE_WINDOW = 8  # Max GET_CHUNK requests in flight per connection
+SWARM_PROBE_SIZE = 256 * 1024  # First slice of a swarmed chunk, fetched to learn its size
+SWARM_MIN_CHUNK_SIZE = 1024 * 1024  # Chunks smaller than this come from a single peer
+
+
+def _sha256_hex(data: bytes) -> str:
+    """Hex SHA-256 digest of data (run in a worker thread)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int):
+    """Write all of data at offset (run in a worker thread)."""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
 
 class ChunkStatus(Enum):
     """Status of a chunk download"""
@@ -36,13 +60,105 @@ class ChunkDownloadTask:
     max_retries: int = 3
 
 
+class AdaptiveConcurrencyController:
+    """
+    AIMD limit on how many chunk requests are in flight at once.
+    
+    Used in place of the downloader's fixed semaphore, with the same
+    acquire/release/locked interface; each pipelined request holds one
+    slot until its response has been read. Every `window` seconds
+    aggregate goodput is compared with the best seen so far: an
+    improvement adds one slot, up to `maximum`. A failed or timed-out
+    request halves the limit, down to `minimum`.
+    """
+    
+    def __init__(self, initial: int = 3, minimum: int = 1, maximum: int = 16, window: float = 1.0):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        
+        self._active = 0
+        self._waiters: List[asyncio.Future] = []
+        self._best_goodput = 0.0
+        self._window_bytes = 0
+        self._window_start: Optional[float] = None
+    
+    def locked(self) -> bool:
+        """True if acquire() would have to wait."""
+        return self._active >= self.limit
+    
+    async def acquire(self):
+        while self.locked():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._active += 1
+    
+    def release(self):
+        self._active -= 1
+        self._wake()
+    
+    async def __aenter__(self):
+        await self.acquire()
+    
+    async def __aexit__(self, *exc):
+        self.release()
+    
+    def _wake(self):
+        """Let waiters re-check the limit."""
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+    
+    def record_bytes(self, nbytes: int):
+        """Count completed bytes; grow the limit if this window beat the best goodput."""
+        now = time.monotonic()
+        if self._window_start is None:
+            self._window_start = now
+        self._window_bytes += nbytes
+        
+        elapsed = now - self._window_start
+        if elapsed < self.window or elapsed <= 0:
+            return
+        
+        goodput = self._window_bytes / elapsed
+        if goodput > self._best_goodput:
+            self._best_goodput = goodput
+            if self.limit < self.maximum:
+                self.limit += 1
+                self._wake()
+        self._window_bytes = 0
+        self._window_start = now
+    
+    def record_failure(self):
+        """Halve the limit after an error or timeout."""
+        self.limit = max(self.minimum, self.limit // 2)
+        self._best_goodput = 0.0
+        self._window_bytes = 0
+        self._window_start = None
+
+
 class P2PChunkDownloader:
     """
     Handles downloading chunks from multiple peers using TCP connection pooling.
     Supports parallel downloads from different peers.
+    
+    One connection is kept open per peer and reused across chunks; requests
+    for several chunks from the same peer are pipelined over it.
     """
     
-    def __init__(self, storage_dir: str, timeout: int = 30, max_connections: int = 5):
+    def __init__(
+        self,
+        storage_dir: str,
+        timeout: int = 30,
+        max_connections: int = 5,
+        idle_timeout: float = 60.0,
+        max_idle_connections: int = 8,
+        controller: Optional[AdaptiveConcurrencyController] = None,
+        socket_rcvbuf: Optional[int] = None
+    ):
         """
         Initialize the chunk downloader.
         
@@ -50,11 +166,194 @@ class P2PChunkDownloader:
             storage_dir: Directory to save downloaded chunks
             timeout: Socket timeout in seconds
             max_connections: Maximum concurrent connections
+            idle_timeout: Seconds before an unused pooled connection is closed
+            max_idle_connections: Pool size above which the least recently
+                used idle connection is closed
+            controller: Optional adaptive limit on in-flight requests, used
+                instead of the fixed max_connections semaphore
+            socket_rcvbuf: Optional fixed SO_RCVBUF for peer connections.
+                Left unset the kernel autotunes the buffer, which a fixed
+                size turns off; the kernel also caps it at net.core.rmem_max
         """
         self.storage_dir = storage_dir
         self.timeout = timeout
         self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.max_idle_connections = max_idle_connections
         self.semaphore = asyncio.Semaphore(max_connections)
+        self.controller = controller
+        self._gate = controller if controller is not None else self.semaphore
+        self.socket_rcvbuf = socket_rcvbuf
+        
+        # Connection pool: (ip, port) -> (reader, writer, last_used)
+        self._conns: Dict[Tuple[str, int], Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = {}
+        self._peer_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+        self._reaper_task: Optional[asyncio.Task] = None
+    
+    def _peer_lock(self, peer: Tuple[str, int]) -> asyncio.Lock:
+        """Get the lock serializing use of a peer's pooled connection."""
+        lock = self._peer_locks.get(peer)
+        if lock is None:
+            lock = self._peer_locks[peer] = asyncio.Lock()
+        return lock
+    
+    async def _get_connection(
+        self,
+        peer: Tuple[str, int]
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Return the pooled connection to a peer, dialing if needed."""
+        conn = self._conns.get(peer)
+        if conn is not None:
+            # at_eof catches a peer that closed the connection while it sat
+            # idle, so the next request doesn't fail on a dead socket
+            if not conn[1].is_closing() and not conn[0].at_eof():
+                return conn[0], conn[1]
+            self._drop_connection(peer)
+        
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(*peer),
+            timeout=self.timeout
+        )
+        self._tune_socket(writer.get_extra_info("socket"))
+        self._conns[peer] = (reader, writer, time.monotonic())
+        if len(self._conns) > self.max_idle_connections:
+            self._evict_lru()
+        
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_idle_connections())
+        
+        return reader, writer
+    
+    def _tune_socket(self, sock: Optional[socket.socket]):
+        """
+        Disable Nagle and turn on keepalive so a pooled connection to a
+        vanished peer is eventually noticed; apply socket_rcvbuf if set.
+        """
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if self.socket_rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_rcvbuf)
+                granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+                # Linux reports twice the usable size, so less than asked for
+                # means the request was capped by net.core.rmem_max
+                log = logger.warning if granted < self.socket_rcvbuf else logger.debug
+                log("[DOWNLOAD] SO_RCVBUF: asked for %d, got %d", self.socket_rcvbuf, granted)
+        except OSError as e:
+            logger.debug(f"Socket tuning failed: {e}")
+    
+    @staticmethod
+    def _quickack(writer: asyncio.StreamWriter):
+        """Ask Linux to ACK immediately (the flag resets after each read)."""
+        if not hasattr(socket, "TCP_QUICKACK"):
+            return
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            except OSError:
+                pass
+    
+    def _record_bytes(self, nbytes: int):
+        """Report completed bytes to the adaptive controller, if any."""
+        if self.controller is not None:
+            self.controller.record_bytes(nbytes)
+    
+    def _record_failure(self):
+        """Report a failed request to the adaptive controller, if any."""
+        if self.controller is not None:
+            self.controller.record_failure()
+    
+    def _release_connection(self, peer: Tuple[str, int]):
+        """Mark a pooled connection as idle as of now."""
+        conn = self._conns.get(peer)
+        if conn is not None:
+            self._conns[peer] = (conn[0], conn[1], time.monotonic())
+    
+    def _drop_connection(self, peer: Tuple[str, int]):
+        """Close and forget a peer's connection (after an error)."""
+        conn = self._conns.pop(peer, None)
+        if conn is not None:
+            conn[1].close()
+    
+    def _evict_lru(self):
+        """Close the least recently used connection that isn't in use."""
+        idle = [
+            (last_used, peer) for peer, (_, _, last_used) in self._conns.items()
+            if not (peer in self._peer_locks and self._peer_locks[peer].locked())
+        ]
+        if idle:
+            self._drop_connection(min(idle)[1])
+    
+    async def _reap_idle_connections(self):
+        """Background task closing connections idle for longer than idle_timeout."""
+        while self._conns:
+            await asyncio.sleep(self.idle_timeout / 2)
+            now = time.monotonic()
+            for peer, (_, writer, last_used) in list(self._conns.items()):
+                lock = self._peer_locks.get(peer)
+                if lock is not None and lock.locked():
+                    continue
+                if now - last_used > self.idle_timeout:
+                    self._drop_connection(peer)
+    
+    async def close(self):
+        """Close all pooled connections."""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        for peer in list(self._conns):
+            self._drop_connection(peer)
+    
+    async def _read_chunk_response(
+        self,
+        reader: asyncio.StreamReader,
+        chunk_hash: str,
+        peer_ip: str,
+        peer_port: int,
+        max_size: int = MAX_FRAME_SIZE
+    ) -> Optional[bytes]:
+        """
+        Read one GET_CHUNK response off a connection.
+        
+        A size over max_size raises before any body is read, so a broken or
+        hostile peer can't make us buffer an arbitrary u32 worth of data.
+        
+        Returns:
+            Chunk data, or None if the peer doesn't have the chunk
+        """
+        # Receive status + chunk size
+        header = await asyncio.wait_for(
+            reader.readexactly(CHUNK_RESPONSE.size),
+            timeout=self.timeout
+        )
+        status, chunk_size = CHUNK_RESPONSE.unpack(header)
+        
+        if status != CHUNK_OK:
+            logger.info("[DOWNLOAD] Peer %s:%d doesn't have chunk %.8s...", peer_ip, peer_port, chunk_hash)
+            return None
+        
+        if chunk_size <= 0:
+            raise Exception("Invalid chunk size")
+        if chunk_size > max_size:
+            raise Exception(f"Chunk size {chunk_size} exceeds limit of {max_size}")
+        
+        # Receive chunk data
+        chunk_data = await asyncio.wait_for(
+            reader.readexactly(chunk_size),
+            timeout=self.timeout
+        )
+        
+        # Verify hash off the event loop; hashlib releases the GIL for large
+        # buffers so concurrent chunk verifications run in parallel
+        calculated_hash = await asyncio.to_thread(_sha256_hex, chunk_data)
+        if calculated_hash != chunk_hash:
+            raise Exception(f"Hash mismatch: expected {chunk_hash}, got {calculated_hash}")
+        
+        logger.debug("[DOWNLOAD] ✓ Chunk %.8s... from %s:%d", chunk_hash, peer_ip, peer_port)
+        return chunk_data
     
     async def download_chunk(
         self,
@@ -73,108 +372,330 @@ class P2PChunkDownloader:
         Returns:
             Chunk data if successful, None if failed
         """
-        async with self.semaphore:
+        results = await self.download_chunks_from_peer([chunk_hash], peer_ip, peer_port)
+        return results.get(chunk_hash)
+    
+    async def download_chunks_from_peer(
+        self,
+        chunk_hashes: List[str],
+        peer_ip: str,
+        peer_port: int,
+        max_chunk_size: Optional[int] = None
+    ) -> Dict[str, Optional[bytes]]:
+        """
+        Download several chunks from one peer over its pooled connection.
+        
+        Up to PIPELINE_WINDOW GET_CHUNK requests are kept in flight and the
+        responses read back in order, so the peer never waits on a round trip
+        between chunks while the amount of unread data stays bounded. Each
+        request holds a concurrency slot from sending until its response
+        is read; the connection only waits for a slot when nothing else is
+        in flight on it, so a shrinking limit narrows the window instead of
+        stalling responses already on the way.
+        
+        Args:
+            chunk_hashes: Hashes of the chunks to download
+            peer_ip: IP address of the peer
+            peer_port: Port of the peer
+            max_chunk_size: Largest size a chunk can be, if known; a peer
+                announcing more is dropped (default MAX_FRAME_SIZE)
+            
+        Returns:
+            Dict mapping chunk_hash -> chunk_data (or None if failed)
+        """
+        peer = (peer_ip, peer_port)
+        max_size = min(max_chunk_size or MAX_FRAME_SIZE, MAX_FRAME_SIZE)
+        results: Dict[str, Optional[bytes]] = {ch: None for ch in chunk_hashes}
+        
+        async with self._peer_lock(peer):
+            held = 0  # Slots held by requests in flight on this connection
             try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(peer_ip, peer_port),
-                    timeout=self.timeout
-                )
+                reader, writer = await self._get_connection(peer)
                 
-                # Send GET_CHUNK request
-                request = {
-                    "type": "GET_CHUNK",
-                    "chunk_hash": chunk_hash
-                }
-                import json
-                writer.write((json.dumps(request) + "\n").encode())
-                await writer.drain()
+                requests = [
+                    CHUNK_REQUEST.pack(GET_CHUNK_OPCODE, bytes.fromhex(ch))
+                    for ch in chunk_hashes
+                ]
                 
-                # Receive chunk size
-                size_line = b""
-                while not size_line.endswith(b"\n"):
-                    chunk = await asyncio.wait_for(
-                        reader.readexactly(1),
-                        timeout=self.timeout
+                sent = 0
+                for i, chunk_hash in enumerate(chunk_hashes):
+                    # Top the window up with as many requests as there are free slots
+                    while (sent < len(requests) and sent - i < PIPELINE_WINDOW
+                           and (sent == i or not self._gate.locked())):
+                        await self._gate.acquire()
+                        held += 1
+                        writer.write(requests[sent])
+                        sent += 1
+                    await writer.drain()
+                    
+                    results[chunk_hash] = data = await self._read_chunk_response(
+                        reader, chunk_hash, peer_ip, peer_port, max_size
                     )
-                    if not chunk:
-                        raise Exception("Connection closed")
-                    size_line += chunk
-                
-                import json
-                size_data = json.loads(size_line.decode().strip())
-                
-                if size_data.get("type") == "ERROR":
-                    print(f"[DOWNLOAD] Peer {peer_ip}:{peer_port} doesn't have chunk {chunk_hash[:8]}...")
-                    return None
+                    held -= 1
+                    self._gate.release()
+                    self._quickack(writer)
+                    if data:
+                        self._record_bytes(len(data))
                 
-                chunk_size = size_data.get("size", 0)
-                if chunk_size <= 0:
-                    raise Exception("Invalid chunk size")
+                self._release_connection(peer)
                 
-                # Receive chunk data
-                chunk_data = await asyncio.wait_for(
-                    reader.readexactly(chunk_size),
-                    timeout=self.timeout
-                )
-                
-                # Verify hash
-                calculated_hash = hashlib.sha256(chunk_data).hexdigest()
-                if calculated_hash != chunk_hash:
-                    raise Exception(f"Hash mismatch: expected {chunk_hash}, got {calculated_hash}")
-                
-                writer.close()
-                await writer.wait_closed()
+            except asyncio.TimeoutError:
+                logger.warning("[DOWNLOAD] ✗ Timeout downloading from %s:%d", peer_ip, peer_port)
+                self._drop_connection(peer)
+                self._record_failure()
+            except Exception as e:
+                logger.warning("[DOWNLOAD] ✗ Error from %s:%d: %s", peer_ip, peer_port, e)
+                self._drop_connection(peer)
+                self._record_failure()
+            except BaseException:
+                # Cancelled mid-batch: responses may be half read, so the
+                # connection can't go back to the pool
+                self._drop_connection(peer)
+                raise
+            finally:
+                for _ in range(held):
+                    self._gate.release()
+        
+        return results
+    
+    async def _fetch_ranges(
+        self,
+        chunk_hash: str,
+        peer: Tuple[str, int],
+        ranges: List[Tuple[int, int]]
+    ) -> Optional[Tuple[int, List[bytes]]]:
+        """
+        Fetch byte ranges of one chunk from a peer, pipelined over its pooled connection.
+        
+        Returns:
+            (chunk size, data for each range), or None if the peer failed
+        """
+        peer_ip, peer_port = peer
+        raw_hash = bytes.fromhex(chunk_hash)
+        
+        async with self._peer_lock(peer), self._gate:
+            try:
+                reader, writer = await self._get_connection(peer)
+                writer.write(b"".join(
+                    RANGE_REQUEST.pack(GET_CHUNK_RANGE_OPCODE, raw_hash, offset, length)
+                    for offset, length in ranges
+                ))
+                await writer.drain()
                 
-                print(f"[DOWNLOAD] ✓ Chunk {chunk_hash[:8]}... from {peer_ip}:{peer_port}")
-                return chunk_data
+                chunk_size = 0
+                slices = []
+                for _, requested in ranges:
+                    header = await asyncio.wait_for(
+                        reader.readexactly(RANGE_RESPONSE.size),
+                        timeout=self.timeout
+                    )
+                    status, chunk_size, length = RANGE_RESPONSE.unpack(header)
+                    if status != CHUNK_OK:
+                        self._release_connection(peer)
+                        return None
+                    if length > requested or chunk_size > MAX_FRAME_SIZE:
+                        raise Exception(f"Range of {length} bytes of a {chunk_size} byte chunk is out of bounds")
+                    slices.append(await asyncio.wait_for(
+                        reader.readexactly(length),
+                        timeout=self.timeout
+                    ))
+                    self._quickack(writer)
+                    self._record_bytes(length)
                 
+                self._release_connection(peer)
+                return chunk_size, slices
+            
             except asyncio.TimeoutError:
-                print(f"[DOWNLOAD] ✗ Timeout downloading from {peer_ip}:{peer_port}")
-                return None
+                logger.warning("[DOWNLOAD] ✗ Timeout downloading from %s:%d", peer_ip, peer_port)
             except Exception as e:
-                print(f"[DOWNLOAD] ✗ Error from {peer_ip}:{peer_port}: {e}")
-                return None
+                logger.warning("[DOWNLOAD] ✗ Error from %s:%d: %s", peer_ip, peer_port, e)
+            except BaseException:
+                # Cancelled with a response possibly half read
+                self._drop_connection(peer)
+                raise
+            self._drop_connection(peer)
+            self._record_failure()
+            return None
+    
+    async def download_chunk_swarm(
+        self,
+        chunk_hash: str,
+        peers: List[Tuple[str, int]]
+    ) -> Optional[bytes]:
+        """
+        Download one chunk as slices fetched from several peers at once.
+        
+        The first SWARM_PROBE_SIZE bytes come from the first peer, which also
+        tells us the chunk size. For chunks of at least SWARM_MIN_CHUNK_SIZE
+        the rest is split evenly across all peers; a slice whose peer fails
+        is retried on the others.
+        
+        Args:
+            chunk_hash: Hash of the chunk to download
+            peers: List of (ip, port) tuples that have the chunk
+            
+        Returns:
+            Chunk data if successful, None if failed
+        """
+        peers = [tuple(p) for p in peers]
+        probe = await self._fetch_ranges(chunk_hash, peers[0], [(0, SWARM_PROBE_SIZE)])
+        if probe is None:
+            return await self.download_with_retry(chunk_hash, peers[1:])
+        
+        chunk_size, (head,) = probe
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        view[:len(head)] = head
+        
+        remaining = chunk_size - len(head)
+        if remaining > 0:
+            slice_peers = peers if chunk_size >= SWARM_MIN_CHUNK_SIZE else peers[:1]
+            step = -(-remaining // len(slice_peers))
+            slices = [
+                (offset, min(step, chunk_size - offset))
+                for offset in range(len(head), chunk_size, step)
+            ]
+            results = await asyncio.gather(*(
+                self._fetch_ranges(chunk_hash, peer, [rng])
+                for peer, rng in zip(slice_peers, slices)
+            ))
+            
+            for i, ((offset, length), result) in enumerate(zip(slices, results)):
+                data = result[1][0] if result is not None else None
+                # Retry a failed slice on the other peers, in order
+                for peer in peers[i + 1:] + peers[:i]:
+                    if data is not None and len(data) == length:
+                        break
+                    result = await self._fetch_ranges(chunk_hash, peer, [(offset, length)])
+                    data = result[1][0] if result is not None else None
+                if data is None or len(data) != length:
+                    logger.warning("[DOWNLOAD] ✗ No peer served chunk %.8s... at offset %d", chunk_hash, offset)
+                    return None
+                view[offset:offset + length] = data
+        
+        calculated_hash = await asyncio.to_thread(_sha256_hex, buf)
+        if calculated_hash != chunk_hash:
+            logger.warning("[DOWNLOAD] ✗ Hash mismatch for swarmed chunk %.8s...", chunk_hash)
+            return None
+        
+        logger.debug("[DOWNLOAD] ✓ Chunk %.8s... from %d peers", chunk_hash, len(peers))
+        return bytes(buf)
     
     async def download_chunks_parallel(
         self,
-        chunk_peers: Dict[str, List[Tuple[str, int]]]
+        chunk_peers: Dict[str, List[Tuple[str, int]]],
+        chunk_size: Optional[int] = None
     ) -> Dict[str, Optional[bytes]]:
         """
         Download multiple chunks from different peers in parallel.
-        Uses first available peer for each chunk.
+        
+        Chunks are grouped by peer so each peer gets one pipelined batch
+        over a single connection. A chunk offered by two or more peers joins
+        the batch of whichever of them has the fewest chunks assigned, and
+        is retried on the others if that peer fails it. Only chunks of at
+        least SWARM_MIN_CHUNK_SIZE are swarmed (see download_chunk_swarm).
         
         Args:
             chunk_peers: Dict mapping chunk_hash -> List[(peer_ip, peer_port)]
+            chunk_size: Size of the chunks, if known
             
         Returns:
             Dict mapping chunk_hash -> chunk_data (or None if failed)
         """
-        tasks = []
-        chunk_order = list(chunk_peers.keys())
-        
+        chunk_data: Dict[str, Optional[bytes]] = {ch: None for ch in chunk_peers}
+        async for batch in self._iter_downloads(chunk_peers, chunk_size):
+            chunk_data.update(batch)
+        return chunk_data
+    
+    async def _iter_downloads(
+        self,
+        chunk_peers: Dict[str, List[Tuple[str, int]]],
+        chunk_size: Optional[int] = None
+    ):
+        """
+        Run the downloads for download_chunks_parallel and yield each
+        result dict (chunk_hash -> data or None) as soon as its peer batch
+        or swarmed chunk finishes, so callers can store data while the
+        rest is still in flight. Without a chunk_size the first shared
+        chunk is probed to decide whether the shared chunks are swarmed.
+        """
+        by_peer: Dict[Tuple[str, int], List[str]] = {}
+        shared: List[str] = []
         for chunk_hash, peers in chunk_peers.items():
-            if peers:
-                peer_ip, peer_port = peers[0]  # Try first peer
-                tasks.append(self.download_chunk(chunk_hash, peer_ip, peer_port))
-            else:
-                tasks.append(asyncio.sleep(0))  # No peers available
+            if len(peers) > 1:
+                shared.append(chunk_hash)
+            elif peers:
+                by_peer.setdefault(tuple(peers[0]), []).append(chunk_hash)
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Only a caller's size bounds every chunk; a probed one may be the
+        # short last chunk
+        max_chunk_size = chunk_size
+        if shared and chunk_size is None:
+            # Size unknown: probe one shared chunk and take its size for the
+            # rest. A chunk the probe returns whole needs nothing further
+            first = shared[0]
+            probe = await self._fetch_ranges(first, tuple(chunk_peers[first][0]), [(0, SWARM_PROBE_SIZE)])
+            if probe is not None:
+                chunk_size, (head,) = probe
+                if len(head) == chunk_size and await asyncio.to_thread(_sha256_hex, head) == first:
+                    shared.pop(0)
+                    yield {first: head}
         
-        chunk_data = {}
-        for chunk_hash, result in zip(chunk_order, results):
-            if isinstance(result, Exception):
-                chunk_data[chunk_hash] = None
-            else:
-                chunk_data[chunk_hash] = result
+        # Single-peer chunks are placed first so each shared chunk sees the
+        # real load of its candidates
+        swarmed: List[str] = []
+        assigned: Dict[str, Tuple[str, int]] = {}
+        for chunk_hash in shared:
+            if chunk_size is not None and chunk_size >= SWARM_MIN_CHUNK_SIZE:
+                swarmed.append(chunk_hash)
+                continue
+            peer = min(
+                (tuple(p) for p in chunk_peers[chunk_hash]),
+                key=lambda p: len(by_peer.get(p, ()))
+            )
+            by_peer.setdefault(peer, []).append(chunk_hash)
+            assigned[chunk_hash] = peer
         
-        return chunk_data
+        async def swarm(chunk_hash: str) -> Dict[str, Optional[bytes]]:
+            return {chunk_hash: await self.download_chunk_swarm(chunk_hash, chunk_peers[chunk_hash])}
+        
+        async def retry(chunk_hash: str, peers: List[Tuple[str, int]]) -> Dict[str, Optional[bytes]]:
+            return {chunk_hash: await self.download_with_retry(chunk_hash, peers, len(peers))}
+        
+        pending = {
+            asyncio.ensure_future(self.download_chunks_from_peer(hashes, peer_ip, peer_port, max_chunk_size))
+            for (peer_ip, peer_port), hashes in by_peer.items()
+        }
+        pending.update(asyncio.ensure_future(swarm(ch)) for ch in swarmed)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        logger.warning("[DOWNLOAD] ✗ Download task failed: %s", e)
+                        continue
+                    # A shared chunk its assigned peer failed gets one more
+                    # round on the other peers before it's reported
+                    for chunk_hash, data in list(results.items()):
+                        peer = assigned.pop(chunk_hash, None)
+                        if data is None and peer is not None:
+                            others = [p for p in chunk_peers[chunk_hash] if tuple(p) != peer]
+                            pending.add(asyncio.ensure_future(retry(chunk_hash, others)))
+                            del results[chunk_hash]
+                    if results:
+                        yield results
+        finally:
+            for task in pending:
+                task.cancel()
     
     async def download_file_chunks(
         self,
         chunk_peers: Dict[str, List[Tuple[str, int]]],
         save_dir: str,
-        progress_callback=None
+        progress_callback=None,
+        chunk_size: Optional[int] = None
     ) -> bool:
         """
         Download all chunks for a file and save them locally.
@@ -183,31 +704,163 @@ class P2PChunkDownloader:
             chunk_peers: Dict mapping chunk_hash -> List[(peer_ip, peer_port)]
             save_dir: Directory to save chunks
             progress_callback: Optional callback for progress updates
+            chunk_size: Size of the chunks, if known
             
         Returns:
             True if all chunks downloaded successfully, False otherwise
         """
-        import os
         os.makedirs(save_dir, exist_ok=True)
         
-        results = await self.download_chunks_parallel(chunk_peers)
-        
+        # Chunks are written as each batch arrives rather than after the
+        # whole file is in memory
+        pending = set(chunk_peers)
         success_count = 0
-        for chunk_hash, chunk_data in results.items():
-            if chunk_data:
-                chunk_path = os.path.join(save_dir, chunk_hash)
-                with open(chunk_path, "wb") as f:
-                    f.write(chunk_data)
-                success_count += 1
-                
-                if progress_callback:
-                    progress_callback(chunk_hash, True)
-            else:
-                if progress_callback:
-                    progress_callback(chunk_hash, False)
+        async for results in self._iter_downloads(chunk_peers, chunk_size):
+            for chunk_hash, chunk_data in results.items():
+                pending.discard(chunk_hash)
+                if chunk_data:
+                    chunk_path = os.path.join(save_dir, chunk_hash)
+                    with open(chunk_path, "wb") as f:
+                        f.write(chunk_data)
+                    success_count += 1
+                    
+                    if progress_callback:
+                        progress_callback(chunk_hash, True)
+                else:
+                    if progress_callback:
+                        progress_callback(chunk_hash, False)
+        
+        # Chunks with no peers, or whose batch failed outright
+        if progress_callback:
+            for chunk_hash in pending:
+                progress_callback(chunk_hash, False)
         
         return success_count == len(chunk_peers)
     
+    async def download_file_to(
+        self,
+        chunk_hashes: List[str],
+        chunk_peers: Dict[str, List[Tuple[str, int]]],
+        output_path: str,
+        file_size: int,
+        chunk_size: Optional[int] = None
+    ) -> bool:
+        """
+        Download a file's data chunks straight into the reassembled file.
+        
+        The output is preallocated to file_size up front and each chunk is
+        written at its offset with pwrite (in worker threads) as soon as its
+        batch arrives, so chunk data is dropped once written instead of
+        being held until the whole file is in memory.  If chunk_size is not
+        known it is taken from the first non-last chunk to arrive; only the
+        last chunk may have to wait for that.  On failure the partial file
+        is removed.
+        
+        Args:
+            chunk_hashes: Data chunk hashes in file order
+            chunk_peers: Dict mapping chunk_hash -> List[(peer_ip, peer_port)]
+            output_path: Path of the file to create
+            file_size: Expected size of the file in bytes
+            chunk_size: Size of every data chunk but the last, if known
+            
+        Returns:
+            True if every chunk was downloaded and the sizes match
+        """
+        positions: Dict[str, List[int]] = {}
+        for index, chunk_hash in enumerate(chunk_hashes):
+            positions.setdefault(chunk_hash, []).append(index)
+        last = len(chunk_hashes) - 1
+        if chunk_size is None and last == 0:
+            chunk_size = file_size  # A lone chunk is the whole file
+        
+        def layout_ok() -> bool:
+            expected = -(-file_size // chunk_size) if chunk_size else 0
+            if len(chunk_hashes) != expected:
+                logger.warning(
+                    "[DOWNLOAD] ✗ %d chunks of %s bytes cannot make %d bytes",
+                    len(chunk_hashes), chunk_size, file_size
+                )
+                return False
+            return True
+        
+        if chunk_size is not None and not layout_ok():
+            return False
+        
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        writes: List[asyncio.Future] = []
+        deferred: Dict[str, bytes] = {}  # Last chunk, until chunk_size is known
+        
+        def place(chunk_hash: str, data: bytes) -> bool:
+            for index in positions[chunk_hash]:
+                if len(data) != min(chunk_size, file_size - index * chunk_size):
+                    logger.warning(
+                        "[DOWNLOAD] ✗ Chunk %s is %d bytes, wrong size for position %d",
+                        chunk_hash[:16], len(data), index
+                    )
+                    return False
+            for index in positions[chunk_hash]:
+                writes.append(asyncio.ensure_future(
+                    asyncio.to_thread(_pwrite_all, fd, data, index * chunk_size)
+                ))
+            return True
+        
+        ok = False
+        pending = set(positions)
+        downloads = self._iter_downloads(
+            {ch: chunk_peers.get(ch, []) for ch in positions}, chunk_size
+        )
+        try:
+            try:
+                os.posix_fallocate(fd, 0, file_size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, file_size)  # No fallocate on this platform/filesystem
+            
+            async for results in downloads:
+                for chunk_hash, chunk_data in results.items():
+                    pending.discard(chunk_hash)
+                    if not chunk_data:
+                        return False
+                    if chunk_size is None:
+                        if positions[chunk_hash] == [last]:
+                            deferred[chunk_hash] = chunk_data
+                            continue
+                        chunk_size = len(chunk_data)
+                        if not layout_ok():
+                            return False
+                        for held_hash, held_data in deferred.items():
+                            if not place(held_hash, held_data):
+                                return False
+                        deferred.clear()
+                    if not place(chunk_hash, chunk_data):
+                        return False
+                
+                # Wait for this batch's writes before taking the next, so
+                # at most one batch of chunk data is held at a time
+                if writes:
+                    await asyncio.wait(writes)
+                    for write in writes:
+                        write.result()
+                    writes.clear()
+            
+            if pending:
+                logger.warning("[DOWNLOAD] ✗ %d chunks were not downloaded", len(pending))
+                return False
+            ok = True
+            return True
+        finally:
+            await downloads.aclose()
+            # asyncio.wait never cancels what it waits on, so even when this
+            # task is cancelled no pwrite is still running once fd is closed
+            running = [write for write in writes if not write.done()]
+            if running:
+                await asyncio.wait(running)
+            os.close(fd)
+            if not ok:
+                try:
+                    os.unlink(output_path)
+                except OSError:
+                    pass
+    
     async def download_with_retry(
         self,
         chunk_hash: str,
@@ -1,51 +1,64 @@
 #!/usr/bin/env python3
-import json
-import socket
+import asyncio
+import os
 import threading
-import sys
 from src.network.dh_utils import (
      generate_private_key, generate_shared_key )
+from src.network.frame_utils import (
+     OP_DATA, OP_TEXT, encode_frame, read_frame, decode_json_payload,
+     encode_key_block, read_key_block )
 from cryptography.hazmat.primitives import serialization
 
-def receive_messages(sock):
+async def receive_messages(reader):
     file = None
 
     try:
         while True:
-            # 1️read metadata line
-            meta_raw = b""
-            while not meta_raw.endswith(b"\n"):
-                chunk = sock.recv(1)
-                if not chunk:
-                    print("\n[INFO] Server disconnected")
-                    return
-                meta_raw += chunk
+            # 1️read next frame
+            try:
+                opcode, payload = await read_frame(reader)
+            except asyncio.IncompleteReadError:
+                print("\n[INFO] Server disconnected")
+                return
+
+            # file bytes for the transfer in progress
+            if opcode == OP_DATA:
+                if file is None:
+                    raise Exception("File data received outside a transfer")
+                file.write(payload)
+                continue
+
+            # normal chat message
+            if opcode == OP_TEXT:
+                print("\n[SERVER]:", payload.decode())
+                print("[YOU]:",end = "", flush=True)
+                continue
 
-            meta = json.loads(meta_raw.decode().strip())
+            meta = decode_json_payload(opcode, payload)
 
             # file start
             if meta.get("type") == "FILE_START":
                 filename = meta.get("name", "received_file")
-                remaining = meta.get("size", 0)
+                size = meta.get("size", 0)
 
-                print(f"[INFO] Receiving file: {filename} ({remaining} bytes)")
+                print(f"[INFO] Receiving file: {filename} ({size} bytes)")
+                # Buffered, so every write lands in full even if the
+                # underlying write(2) is short
                 file = open(filename, "wb")
-
-                # exact file bytes
-                while remaining > 0:
-                    data = sock.recv(min(4096, remaining))
-                    if not data:
-                        raise Exception("Connection lost during file transfer")
-                    file.write(data)
-                    remaining -= len(data)
-
-                file.close()
+                if size > 0 and hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(file.fileno(), 0, size)
+
+            # file end
+            elif meta.get("type") == "FILE_END":
+                if file:
+                    # drop any preallocated tail if chunks were skipped
+                    file.truncate(file.tell())
+                    file.close()
                 file = None
                 print("[INFO] File transfer completed\n")
                 print("[YOU]:", end = "", flush=True)
-            
 
-            # normal message
+            # other control message
             else:
                 print("\n[SERVER]:", meta)
                 print("[YOU]:",end = "", flush=True)
@@ -55,81 +68,91 @@ def receive_messages(sock):
     finally:
         if file:
             file.close()
-        sock.close()
-
-
 
 
+def _read_stdin(loop, queue):
+    """Feed stdin lines into the event loop (input() has no async form)."""
+    try:
+        while True:
+            line = input("[YOU]: ")
+            loop.call_soon_threadsafe(queue.put_nowait, line)
+    except EOFError:
+        loop.call_soon_threadsafe(queue.put_nowait, None)
 
 
+async def send_messages(writer):
 
-def send_messages(sock):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # daemon thread only blocks on the terminal; all socket I/O stays on the loop
+    threading.Thread(target=_read_stdin, args=(loop, queue), daemon=True).start()
 
     try:
         while True:
-            msg = input("[YOU]: ")
-            if msg.lower() == "quit":
+            msg = await queue.get()
+            if msg is None or msg.lower() == "quit":
                 print("[INFO] Closing connection...")
-                sock.close()
-                sys.exit(0)
-            sock.send((msg + "\n").encode())
+                return
+            writer.write(encode_frame(OP_TEXT, msg.encode()))
+            await writer.drain()
     except Exception as e:
         print(f"\n[ERROR] Sending message: {e}")
-        sock.close()
 
 
-def main():
-    """Main client function"""
-    HOST = "127.0.0.1"
-    PORT = 9000
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+async def main_async(host, port):
+    print(f"[INFO] Connecting to server at {host}:{port}...")
+    reader, writer = await asyncio.open_connection(host, port)
 
     try:
-        print(f"[INFO] Connecting to server at {HOST}:{PORT}...")
-        sock.connect((HOST, PORT))
         print("[INFO] Connected to server!")
         print("[INFO] Type 'quit' to exit\n")
 
         # diffie hellman handshake
         # receive parameters from server
-        params_bytes = sock.recv(2048)
-        dh_params = serialization.load_pem_parameters(params_bytes)
+        params_bytes = await read_key_block(reader)
+        dh_params = serialization.load_der_parameters(params_bytes)
         client_private_key = generate_private_key(dh_params)
         client_public_key = client_private_key.public_key()
         print("[SECURITY] Diffie Hellman handshake initiated on Client")
         client_pub_bytes = client_public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
+            encoding=serialization.Encoding.DER,
             format=serialization.PublicFormat.SubjectPublicKeyInfo
         )
-        sock.sendall(client_pub_bytes)
+        writer.write(encode_key_block(client_pub_bytes))
+        await writer.drain()
         # receive server's public key
-        server_pub_bytes = sock.recv(2048)
-        server_public_key = serialization.load_pem_public_key(server_pub_bytes)
+        server_pub_bytes = await read_key_block(reader)
+        server_public_key = serialization.load_der_public_key(server_pub_bytes)
         #derive shared key
         shared_key = generate_shared_key(client_private_key, server_public_key)
         print("[SECURITY] Diffie Hellman handshake completed on CLIENT")
-        # Start threads for sending and receiving
-        recv_thread = threading.Thread(
-            target=receive_messages, args=(sock,), daemon=True
+
+        # Receive and send concurrently on one thread; stop when either side ends
+        recv_task = asyncio.create_task(receive_messages(reader))
+        send_task = asyncio.create_task(send_messages(writer))
+        done, pending = await asyncio.wait(
+            {recv_task, send_task}, return_when=asyncio.FIRST_COMPLETED
         )
-        send_thread = threading.Thread(target=send_messages, args=(sock,), daemon=True)
+        for task in pending:
+            task.cancel()
 
-        recv_thread.start()
-        send_thread.start()
+    finally:
+        writer.close()
 
-        # Keep main thread alive
-        recv_thread.join()
-        send_thread.join()
 
+def main():
+    """Main client function"""
+    HOST = "127.0.0.1"
+    PORT = 9000
+
+    try:
+        asyncio.run(main_async(HOST, PORT))
     except ConnectionRefusedError:
         print("[ERROR] Could not connect to server. Make sure the server is running.")
     except KeyboardInterrupt:
         print("\n[INFO] Client shutting down...")
     except Exception as e:
         print(f"[ERROR] {e}")
-    finally:
-        sock.close()
 
 
 if __name__ == "__main__":
@@ -10,7 +10,7 @@ import logging
 from typing import Optional
 from src.dht.kademlia import KademliaNode
 from src.network.p2p_peer_manager import P2PPeerManager
-from src.network.p2p_chunk_downloader import P2PChunkDownloader
+from src.network.p2p_chunk_downloader import AdaptiveConcurrencyController, P2PChunkDownloader
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,10 +34,12 @@ class P2PClient:
         Args:
             dht_bootstrap_nodes: List of (ip, port) tuples for DHT bootstrap
             download_dir: Directory to save downloaded files
-            max_concurrent: Max concurrent chunk downloads
+            max_concurrent: Initial concurrent chunk downloads; adapted
+                to observed throughput while downloading
         """
         self.dht_bootstrap_nodes = dht_bootstrap_nodes
         self.download_dir = download_dir
+        self.max_concurrent = max_concurrent
         
         self.dht_node: Optional[KademliaNode] = None
         self.peer_manager: Optional[P2PPeerManager] = None
@@ -72,7 +74,11 @@ class P2PClient:
         )
         
         # Create downloader
-        self.chunk_downloader = P2PChunkDownloader(self.download_dir)
+        self.chunk_downloader = P2PChunkDownloader(
+            self.download_dir,
+            max_connections=self.max_concurrent,
+            controller=AdaptiveConcurrencyController(initial=self.max_concurrent)
+        )
         
         logger.info("[CLIENT] Initialization complete")
         return True
@@ -140,21 +146,31 @@ class P2PClient:
         
         import os
         os.makedirs(self.download_dir, exist_ok=True)
+        output_path = os.path.join(self.download_dir, output_name or file_meta.original_name)
         
-        success = await self.chunk_downloader.download_file_chunks(
+        # Chunks are written straight into the reassembled file
+        success = await self.chunk_downloader.download_file_to(
+            file_meta.data_chunks,
             download_map,
-            self.download_dir
+            output_path,
+            file_meta.size,
+            file_meta.chunk_size
         )
         
         if success:
-            logger.info(f"[CLIENT] ✓ Download complete: {file_meta.original_name}")
+            logger.info(f"[CLIENT] ✓ Download complete: {output_path}")
         else:
             logger.error(f"[CLIENT] ✗ Download failed: missing chunks")
+            # Peers may have gone away; re-resolve on the next attempt
+            for chunk_hash in download_map:
+                self.peer_manager.invalidate_peer_cache(chunk_hash)
         
         return success
     
     async def shutdown(self):
         """Cleanup resources"""
+        if self.chunk_downloader:
+            await self.chunk_downloader.close()
         if self.dht_node:
             await self.dht_node.stop()
         logger.info("[CLIENT] Shutdown complete")
@@ -4,20 +4,50 @@ P2P Node - Hybrid server/client node that serves chunks and downloads from peers
 Acts as both a file server and client in the P2P network.
 """
 
-import socket
-import threading
 import asyncio
 import json
+import socket
 import os
+import time
 import logging
-from typing import Optional, Dict, Set
-from src.dht.kademlia import KademliaNode
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Set, Tuple, BinaryIO
+from src.dht.kademlia import KademliaNode, REPUBLISH_INTERVAL
 from src.network.p2p_peer_manager import P2PPeerManager
 from src.network.p2p_chunk_downloader import P2PChunkDownloader
+from src.network.frame_utils import (
+    CHUNK_MISSING, CHUNK_OK, CHUNK_REQUEST, CHUNK_RESPONSE, GET_CHUNK_OPCODE,
+    GET_CHUNK_RANGE_OPCODE, RANGE_REQUEST, RANGE_RESPONSE
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+METADATA_PUBLISH_CONCURRENCY = 8  # Max concurrent DHT metadata publishes
+PUBLISHED_FILE = "published_metadata.json"  # When each file's metadata was last published
+
+try:
+    import resource
+    CHUNK_FD_CACHE_SIZE = max(16, resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 2)
+except (ImportError, ValueError):
+    CHUNK_FD_CACHE_SIZE = 256  # No RLIMIT_NOFILE (e.g. Windows)
+
+# Fixed replies, encoded once instead of per request
+ERROR_REPLY = json.dumps({"type": "ERROR"}).encode()
+UNKNOWN_REQUEST_REPLY = json.dumps({"type": "ERROR", "message": "Unknown request"}).encode()
+
+
+class _ChunkFile:
+    """An open chunk file, shared by the requests sending from it."""
+    __slots__ = ("file", "size", "holders", "cached")
+    
+    def __init__(self, file: BinaryIO, size: int):
+        self.file = file
+        self.size = size
+        self.holders = 0  # Requests currently sending from the file
+        self.cached = True  # Once evicted, the last holder to release it closes it
+
 
 class P2PNode:
     """
@@ -31,7 +61,8 @@ class P2PNode:
         server_port: int,
         dht_port: int,
         storage_dir: str,
-        max_concurrent_downloads: int = 5
+        max_concurrent_downloads: int = 5,
+        socket_sndbuf: Optional[int] = None
     ):
         """
         Initialize a P2P node.
@@ -43,12 +74,17 @@ class P2PNode:
             dht_port: Port for DHT communication
             storage_dir: Directory for storing chunks
             max_concurrent_downloads: Max parallel chunk downloads
+            socket_sndbuf: Optional fixed SO_SNDBUF for client connections.
+                Left unset the kernel autotunes the buffer, which a fixed
+                size turns off; the kernel also caps it at net.core.wmem_max
         """
         self.node_id = node_id
         self.server_host = server_host
         self.server_port = server_port
         self.dht_port = dht_port
         self.storage_dir = storage_dir
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.socket_sndbuf = socket_sndbuf
         
         # Components
         self.dht_node: Optional[KademliaNode] = None
@@ -56,10 +92,25 @@ class P2PNode:
         self.chunk_downloader: Optional[P2PChunkDownloader] = None
         
         # Server state
-        self.server_socket: Optional[socket.socket] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._server_task: Optional[asyncio.Task] = None
         self.server_running = False
         self.client_connections: Set[tuple] = set()
-        self.connections_lock = threading.Lock()
+        self._client_writers: Set[asyncio.StreamWriter] = set()
+        # Open chunk files in LRU order: chunk_hash -> _ChunkFile
+        self._chunk_files: "OrderedDict[str, _ChunkFile]" = OrderedDict()
+        # Blocking disk work (opening chunks, reading the index) runs here
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 1) * 2),
+            thread_name_prefix="p2p-io"
+        )
+        
+        # Parsed cas_index.json, reloaded only when its mtime changes
+        self._index_cache: Dict[str, dict] = {}
+        self._index_mtime: Optional[int] = None
+        # Encoded FILE_LIST / FILE_METADATA replies derived from the index
+        self._file_list_bytes: Optional[bytes] = None
+        self._meta_bytes: Dict[str, bytes] = {}
         
         # Event loop
         self.loop: Optional[asyncio.AbstractEventLoop] = None
@@ -100,11 +151,9 @@ class P2PNode:
 
         # Publish file metadata for any files in our local CAS index so clients can discover them
         try:
-            index_path = os.path.join(self.storage_dir, "cas_index.json")
-            if os.path.exists(index_path):
-                with open(index_path, "r") as f:
-                    index = json.load(f)
-
+            index = await self._get_index()
+            metas = []
+            if index:
                 for file_hash, meta in index.items():
                     # Build FileMetadata dataclass from peer manager definition
                     try:
@@ -113,7 +162,8 @@ class P2PNode:
                             original_name=meta.get("original_name"),
                             size=meta.get("size"),
                             data_chunks=meta.get("data_chunks", []),
-                            parity_chunks=meta.get("parity_chunks", [])
+                            parity_chunks=meta.get("parity_chunks", []),
+                            chunk_size=meta.get("chunk_size")
                         )
                     except Exception:
                         # Fallback: construct using the dataclass from module
@@ -123,151 +173,390 @@ class P2PNode:
                             original_name=meta.get("original_name"),
                             size=meta.get("size"),
                             data_chunks=meta.get("data_chunks", []),
-                            parity_chunks=meta.get("parity_chunks", [])
+                            parity_chunks=meta.get("parity_chunks", []),
+                            chunk_size=meta.get("chunk_size")
                         )
 
-                    # Publish metadata to DHT
-                    await self.peer_manager.publish_file_metadata(file_meta)
+                    metas.append(file_meta)
+
+            # Skip files published within the last REPUBLISH_INTERVAL (e.g.
+            # before a quick restart); their DHT entries are still live
+            published = self._load_published()
+            now = time.time()
+            metas = [
+                m for m in metas
+                if now - published.get(self._published_key(m), 0) >= REPUBLISH_INTERVAL
+            ]
+
+            # Publish metadata to DHT, overlapping the lookups but keeping a
+            # bounded number in flight
+            publish_sem = asyncio.Semaphore(METADATA_PUBLISH_CONCURRENCY)
+            # With no peers the DHT only stores locally, which a restart loses
+            has_peers = bool(self.dht_node.routing_table.get_all_nodes())
+
+            async def publish(file_meta):
+                async with publish_sem:
+                    stored = await self.peer_manager.publish_file_metadata(file_meta)
+                    if stored and has_peers:
+                        published[self._published_key(file_meta)] = now
+
+            await asyncio.gather(*(publish(m) for m in metas), return_exceptions=True)
+            if metas:
+                self._save_published(published)
         except Exception as e:
             logger.warning(f"[DHT] Failed publishing local file metadata: {e}")
         
         # Create chunk downloader
-        self.chunk_downloader = P2PChunkDownloader(self.storage_dir)
+        self.chunk_downloader = P2PChunkDownloader(
+            self.storage_dir,
+            max_connections=self.max_concurrent_downloads
+        )
         
         logger.info("[P2P] Node initialization complete")
     
-    def start_server(self):
-        """Start the TCP server for serving chunks (runs in thread)"""
-        def run_server():
-            try:
-                self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                self.server_socket.bind((self.server_host, self.server_port))
-                self.server_socket.listen(10)
-                
-                self.server_running = True
-                logger.info(f"[SERVER] Listening on {self.server_host}:{self.server_port}")
-                
-                while self.server_running:
-                    try:
-                        self.server_socket.settimeout(1.0)
-                        conn, addr = self.server_socket.accept()
-                        
-                        # Handle client in new thread
-                        client_thread = threading.Thread(
-                            target=self._handle_client,
-                            args=(conn, addr),
-                            daemon=True
-                        )
-                        client_thread.start()
-                        
-                    except socket.timeout:
-                        continue
-                    except Exception as e:
-                        logger.error(f"[SERVER] Accept error: {e}")
-                        break
+    def start_server(self) -> asyncio.Task:
+        """
+        Start the TCP server for serving chunks.
+        
+        Must be called from a running event loop; the server runs as a
+        task on that loop and handles every client connection there.
+        """
+        self.loop = asyncio.get_running_loop()
+        self._server_task = self.loop.create_task(self._run_server())
+        return self._server_task
+    
+    async def _run_server(self):
+        """Accept connections until shutdown"""
+        try:
+            self.server = await asyncio.start_server(
+                self._handle_client,
+                self.server_host,
+                self.server_port,
+                reuse_address=True,
+                backlog=10
+            )
             
-            except Exception as e:
-                logger.error(f"[SERVER] Error: {e}")
-            finally:
-                if self.server_socket:
-                    self.server_socket.close()
-                self.server_running = False
+            self.server_running = True
+            logger.info(f"[SERVER] Listening on {self.server_host}:{self.server_port}")
+            
+            async with self.server:
+                await self.server.serve_forever()
         
-        server_thread = threading.Thread(target=run_server, daemon=True)
-        server_thread.start()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"[SERVER] Error: {e}")
+        finally:
+            self.server_running = False
     
-    def _handle_client(self, conn: socket.socket, addr: tuple):
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Handle a client connection requesting chunks or file metadata"""
+        addr = writer.get_extra_info("peername")
         logger.info(f"[SERVER] Client connected: {addr}")
         
         try:
-            with self.connections_lock:
-                self.client_connections.add(addr)
+            self.client_connections.add(addr)
+            self._client_writers.add(writer)
+            self._tune_socket(writer.get_extra_info("socket"))
             
             while True:
-                # Read request header (JSON)
-                request_data = b""
-                while not request_data.endswith(b"\n"):
-                    chunk = conn.recv(1)
-                    if not chunk:
-                        break
-                    request_data += chunk
-                
-                if not request_data:
+                # Binary GET_CHUNK requests are a fixed-size struct
+                first = await reader.read(1)
+                if not first:
                     break
+                if first[0] == GET_CHUNK_OPCODE:
+                    raw_hash = await reader.readexactly(CHUNK_REQUEST.size - 1)
+                    await self._serve_chunk(writer, raw_hash.hex(), binary=True)
+                    continue
+                
+                if first[0] == GET_CHUNK_RANGE_OPCODE:
+                    _, raw_hash, offset, length = RANGE_REQUEST.unpack(
+                        first + await reader.readexactly(RANGE_REQUEST.size - 1)
+                    )
+                    await self._serve_chunk_range(writer, raw_hash.hex(), offset, length)
+                    continue
                 
-                request = json.loads(request_data.decode().strip())
+                # Other requests are newline-terminated JSON
+                body = first + await reader.readuntil(b"\n")
+                request = json.loads(body)
                 request_type = request.get("type")
                 
                 # ===== GET_CHUNK =====
                 if request_type == "GET_CHUNK":
                     chunk_hash = request.get("chunk_hash")
-                    self._serve_chunk(conn, chunk_hash)
+                    await self._serve_chunk(writer, chunk_hash)
+                    await writer.drain()
+                    continue
                 
                 # ===== LIST_FILES =====
                 elif request_type == "LIST_FILES":
-                    self._serve_file_list(conn)
+                    response = await self._file_list_response()
                 
                 # ===== GET_FILE_METADATA =====
                 elif request_type == "GET_FILE_METADATA":
                     file_hash = request.get("file_hash")
-                    self._serve_file_metadata(conn, file_hash)
+                    response = await self._file_metadata_response(file_hash)
                 
                 else:
-                    conn.sendall(json.dumps({"type": "ERROR", "message": "Unknown request"}).encode() + b"\n")
+                    response = UNKNOWN_REQUEST_REPLY
+                
+                writer.write(response + b"\n")
+                await writer.drain()
         
+        except asyncio.IncompleteReadError:
+            pass
         except Exception as e:
             logger.error(f"[SERVER] Error handling {addr}: {e}")
         
         finally:
-            conn.close()
-            with self.connections_lock:
-                self.client_connections.discard(addr)
+            writer.close()
+            self._client_writers.discard(writer)
+            self.client_connections.discard(addr)
             logger.info(f"[SERVER] Client disconnected: {addr}")
     
-    def _serve_chunk(self, conn: socket.socket, chunk_hash: str):
-        """Serve a chunk if we have it"""
-        chunk_path = os.path.join(self.storage_dir, chunk_hash)
+    def _tune_socket(self, sock):
+        """Disable Nagle and apply socket_sndbuf, if set, on a client connection."""
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.socket_sndbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_sndbuf)
+                granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+                # Linux reports twice the usable size, so less than asked for
+                # means the request was capped by net.core.wmem_max
+                log = logger.warning if granted < self.socket_sndbuf else logger.debug
+                log("[SERVER] SO_SNDBUF: asked for %d, got %d", self.socket_sndbuf, granted)
+        except OSError as e:
+            logger.debug(f"[SERVER] Socket tuning failed: {e}")
+    
+    @staticmethod
+    def _set_cork(writer: asyncio.StreamWriter, on: bool):
+        """
+        Toggle TCP_CORK (Linux) so a reply header and its sendfile body
+        leave in full segments; uncorking flushes what is left.
+        """
+        if not hasattr(socket, "TCP_CORK"):
+            return
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if on else 0)
+            except OSError:
+                pass
+    
+    async def _serve_chunk(self, writer: asyncio.StreamWriter, chunk_hash: str, binary: bool = False):
+        """
+        Serve a chunk if we have it.
         
+        With binary=True the reply header is a CHUNK_RESPONSE struct
+        instead of a JSON line. The body goes out through loop.sendfile,
+        which uses os.sendfile (zero-copy) where the platform allows.
+        """
+        header_sent = False
         try:
-            if not os.path.exists(chunk_path):
-                conn.sendall(json.dumps({"type": "ERROR"}).encode() + b"\n")
+            opened = await self._open_chunk(chunk_hash)
+            if opened is None:
+                if binary:
+                    writer.write(CHUNK_RESPONSE.pack(CHUNK_MISSING, 0))
+                else:
+                    writer.write(ERROR_REPLY + b"\n")
                 return
             
-            # Send size header
-            chunk_size = os.path.getsize(chunk_path)
-            conn.sendall(
-                json.dumps({"type": "CHUNK_START", "size": chunk_size}).encode() + b"\n"
-            )
-            
-            # Send chunk data
-            with open(chunk_path, "rb") as f:
-                while True:
-                    data = f.read(4096)
-                    if not data:
-                        break
-                    conn.sendall(data)
+            chunk_size = opened.size
+            self._set_cork(writer, True)
+            try:
+                # Send size header
+                if binary:
+                    writer.write(CHUNK_RESPONSE.pack(CHUNK_OK, chunk_size))
+                else:
+                    writer.write(b'{"type": "CHUNK_START", "size": %d}\n' % chunk_size)
+                header_sent = True
+                await writer.drain()
+                
+                # Send chunk data
+                await self.loop.sendfile(writer.transport, opened.file, 0, chunk_size)
+            finally:
+                self._set_cork(writer, False)
+                self._release_chunk(opened)
             
-            logger.info(f"[SERVER] Served chunk {chunk_hash[:8]}... to {conn.getpeername()}")
+            logger.info(f"[SERVER] Served chunk {chunk_hash[:8]}... to {writer.get_extra_info('peername')}")
         
         except Exception as e:
             logger.error(f"[SERVER] Error serving chunk: {e}")
+            if header_sent:
+                # Part of the body may be out already; an error reply now
+                # would be read as chunk data, so drop the connection
+                writer.close()
+                return
             try:
-                conn.sendall(json.dumps({"type": "ERROR"}).encode() + b"\n")
+                if binary:
+                    writer.write(CHUNK_RESPONSE.pack(CHUNK_MISSING, 0))
+                else:
+                    writer.write(ERROR_REPLY + b"\n")
             except:
                 pass
     
-    def _serve_file_list(self, conn: socket.socket):
-        """Serve list of available files"""
+    async def _serve_chunk_range(self, writer: asyncio.StreamWriter, chunk_hash: str, offset: int, length: int):
+        """
+        Serve bytes [offset, offset + length) of a chunk, clamped to its size.
+        
+        Lets a downloader fetch slices of one chunk from several peers at once.
+        """
+        header_sent = False
         try:
-            index_path = os.path.join(self.storage_dir, "cas_index.json")
-            files = []
+            opened = await self._open_chunk(chunk_hash)
+            if opened is None:
+                writer.write(RANGE_RESPONSE.pack(CHUNK_MISSING, 0, 0))
+                return
             
-            if os.path.exists(index_path):
-                with open(index_path, "r") as f:
-                    index = json.load(f)
+            chunk_size = opened.size
+            offset = min(offset, chunk_size)
+            length = min(length, chunk_size - offset)
+            self._set_cork(writer, True)
+            try:
+                writer.write(RANGE_RESPONSE.pack(CHUNK_OK, chunk_size, length))
+                header_sent = True
+                await writer.drain()
                 
+                if length:
+                    await self.loop.sendfile(writer.transport, opened.file, offset, length)
+            finally:
+                self._set_cork(writer, False)
+                self._release_chunk(opened)
+            
+            logger.debug("[SERVER] Served %d bytes of chunk %.8s... at offset %d", length, chunk_hash, offset)
+        
+        except Exception as e:
+            logger.error(f"[SERVER] Error serving chunk range: {e}")
+            if header_sent:
+                writer.close()  # As in _serve_chunk
+                return
+            try:
+                writer.write(RANGE_RESPONSE.pack(CHUNK_MISSING, 0, 0))
+            except:
+                pass
+    
+    @staticmethod
+    def _open_chunk_file(chunk_path: str) -> Optional[Tuple[BinaryIO, int]]:
+        """Open a chunk for reading and get its size (run in the I/O pool)."""
+        try:
+            f = open(chunk_path, "rb", buffering=0)
+        except OSError:
+            return None
+        return f, os.fstat(f.fileno()).st_size
+    
+    async def _open_chunk(self, chunk_hash: str) -> Optional[_ChunkFile]:
+        """
+        Lease an open file for a chunk, or return None if we don't have it.
+        
+        Files stay open in an LRU of CHUNK_FD_CACHE_SIZE entries so hot
+        chunks skip the path lookup and open/close on every request; misses
+        are opened in the I/O pool so a slow disk doesn't stall the loop. Sharing
+        one file between connections is safe: sendfile reads at an explicit
+        offset, and chunks are content-addressed so never change. Every
+        lease must be handed back with _release_chunk.
+        """
+        cached = self._chunk_files.get(chunk_hash)
+        if cached is None:
+            opened = await asyncio.get_running_loop().run_in_executor(
+                self._io_executor, self._open_chunk_file, os.path.join(self.storage_dir, chunk_hash)
+            )
+            if opened is None:
+                return None
+            
+            cached = self._chunk_files.get(chunk_hash)
+            if cached is not None:
+                # Another request opened it while we waited
+                opened[0].close()
+            else:
+                cached = self._chunk_files[chunk_hash] = _ChunkFile(*opened)
+                if len(self._chunk_files) > CHUNK_FD_CACHE_SIZE:
+                    _, evicted = self._chunk_files.popitem(last=False)
+                    evicted.cached = False
+                    if not evicted.holders:
+                        evicted.file.close()
+        
+        self._chunk_files.move_to_end(chunk_hash)
+        cached.holders += 1
+        return cached
+    
+    @staticmethod
+    def _release_chunk(chunk: _ChunkFile):
+        """Hand back a lease from _open_chunk, closing the file if it was evicted."""
+        chunk.holders -= 1
+        if not chunk.holders and not chunk.cached:
+            chunk.file.close()
+    
+    def _close_chunk_files(self):
+        """Close every cached chunk file; ones still being sent close on release."""
+        for chunk in self._chunk_files.values():
+            chunk.cached = False
+            if not chunk.holders:
+                chunk.file.close()
+        self._chunk_files.clear()
+    
+    @staticmethod
+    def _published_key(file_meta) -> str:
+        """Identify a published file and its chunk layout."""
+        return f"{file_meta.file_hash}:{len(file_meta.data_chunks)}"
+    
+    def _load_published(self) -> Dict[str, float]:
+        """Read the record of when each file's metadata was last published."""
+        try:
+            with open(os.path.join(self.storage_dir, PUBLISHED_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_published(self, published: Dict[str, float]):
+        """Persist the publish record, dropping entries too old to matter."""
+        cutoff = time.time() - REPUBLISH_INTERVAL
+        try:
+            with open(os.path.join(self.storage_dir, PUBLISHED_FILE), "w") as f:
+                json.dump({k: ts for k, ts in published.items() if ts >= cutoff}, f)
+        except OSError as e:
+            logger.warning(f"[DHT] Could not save publish record: {e}")
+    
+    @staticmethod
+    def _read_index_file(index_path: str) -> Dict[str, dict]:
+        """Read and parse cas_index.json (run in the I/O pool)."""
+        with open(index_path, "rb") as f:
+            return json.loads(f.read())
+    
+    async def _get_index(self) -> Dict[str, dict]:
+        """
+        Return the parsed cas_index.json.
+        
+        The file is only re-read when its mtime changes; a missing index
+        is treated as empty. Reloading drops the cached encoded replies.
+        """
+        index_path = os.path.join(self.storage_dir, "cas_index.json")
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+            if self._index_mtime is not None:
+                self._index_cache = {}
+        else:
+            if mtime != self._index_mtime:
+                self._index_cache = await asyncio.get_running_loop().run_in_executor(
+                    self._io_executor, self._read_index_file, index_path
+                )
+        
+        if mtime != self._index_mtime:
+            self._index_mtime = mtime
+            self._file_list_bytes = None
+            self._meta_bytes = {}
+        return self._index_cache
+    
+    async def _file_list_response(self) -> bytes:
+        """Encoded FILE_LIST reply (without framing)"""
+        try:
+            index = await self._get_index()
+            
+            if self._file_list_bytes is None:
+                files = []
                 for file_hash, meta in index.items():
                     files.append({
                         "name": meta.get("original_name"),
@@ -275,46 +564,42 @@ class P2PNode:
                         "size": meta.get("size"),
                         "available_on": self.node_id  # Which node has this
                     })
+                
+                self._file_list_bytes = json.dumps({"type": "FILE_LIST", "files": files}).encode()
             
-            conn.sendall(
-                json.dumps({"type": "FILE_LIST", "files": files}).encode() + b"\n"
-            )
+            return self._file_list_bytes
         
         except Exception as e:
             logger.error(f"[SERVER] Error listing files: {e}")
-            conn.sendall(json.dumps({"type": "ERROR"}).encode() + b"\n")
+            return ERROR_REPLY
     
-    def _serve_file_metadata(self, conn: socket.socket, file_hash: str):
-        """Serve metadata for a specific file"""
+    async def _file_metadata_response(self, file_hash: str) -> bytes:
+        """Encoded FILE_METADATA reply for a specific file (without framing)"""
         try:
-            index_path = os.path.join(self.storage_dir, "cas_index.json")
-            
-            if not os.path.exists(index_path):
-                conn.sendall(json.dumps({"type": "ERROR"}).encode() + b"\n")
-                return
-            
-            with open(index_path, "r") as f:
-                index = json.load(f)
+            index = await self._get_index()
             
             if file_hash not in index:
-                conn.sendall(json.dumps({"type": "ERROR"}).encode() + b"\n")
-                return
+                return ERROR_REPLY
             
-            meta = index[file_hash]
-            conn.sendall(
-                json.dumps({
+            response = self._meta_bytes.get(file_hash)
+            if response is None:
+                meta = index[file_hash]
+                response = json.dumps({
                     "type": "FILE_METADATA",
                     "file_hash": file_hash,
                     "original_name": meta.get("original_name"),
                     "size": meta.get("size"),
                     "data_chunks": meta.get("data_chunks", []),
-                    "parity_chunks": meta.get("parity_chunks", [])
-                }).encode() + b"\n"
-            )
+                    "parity_chunks": meta.get("parity_chunks", []),
+                    "chunk_size": meta.get("chunk_size")
+                }).encode()
+                self._meta_bytes[file_hash] = response
+            
+            return response
         
         except Exception as e:
             logger.error(f"[SERVER] Error serving metadata: {e}")
-            conn.sendall(json.dumps({"type": "ERROR"}).encode() + b"\n")
+            return ERROR_REPLY
     
     async def download_file_from_peers(
         self,
@@ -351,7 +636,8 @@ class P2PNode:
         
         success = await self.chunk_downloader.download_file_chunks(
             download_peers,
-            output_dir
+            output_dir,
+            chunk_size=file_meta.chunk_size
         )
         
         if success:
@@ -365,6 +651,18 @@ class P2PNode:
         """Shutdown the node"""
         logger.info("[P2P] Shutting down...")
         self.server_running = False
+        if self.server:
+            self.server.close()
+        # Server.close() leaves accepted connections open; end them too
+        for writer in list(self._client_writers):
+            writer.close()
+        if self._server_task:
+            self._server_task.cancel()
+        self._close_chunk_files()
+        self._io_executor.shutdown(wait=False)
+        
+        if self.chunk_downloader:
+            await self.chunk_downloader.close()
         
         if self.dht_node:
             await self.dht_node.stop()
@@ -7,20 +7,46 @@ Each node acts as both client and server.
 import asyncio
 import json
 import hashlib
+import heapq
 import os
+import sys
+import time
 from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
 from src.dht.kademlia import KademliaNode
 
+PEER_CACHE_TTL = 300.0  # seconds a chunk -> peers lookup stays fresh
+CHUNK_LOOKUP_CONCURRENCY = 16  # Max concurrent DHT chunk lookups
+REGISTER_CONCURRENCY = 20  # Max concurrent DHT chunk registrations
+# Bookkeeping files kept alongside chunks in the storage directory
+NON_CHUNK_FILES = frozenset({
+    "cas_index.json", "cas_index.json.tmp", "dht_storage.json", "published_metadata.json"
+})
+# Slotted dataclasses where supported (3.10+); plain ones otherwise
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+def _scan_chunk_names(storage_dir: str) -> Set[str]:
+    """Names of the regular files in storage_dir that are chunks"""
+    try:
+        with os.scandir(storage_dir) as entries:
+            return {
+                entry.name for entry in entries
+                if entry.name not in NON_CHUNK_FILES
+                and entry.is_file(follow_symlinks=False)
+            }
+    except FileNotFoundError:
+        return set()
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class PeerInfo:
     """Information about a peer in the network"""
     node_id: str
     ip: str
     port: int
     chunks: Set[str] = field(default_factory=set)  # Chunk hashes this peer has
-    last_seen: float = field(default_factory=lambda: __import__('time').time())
+    last_seen: float = field(default_factory=time.time)
     
     def __hash__(self):
         return hash((self.node_id, self.ip, self.port))
@@ -31,7 +57,7 @@ class PeerInfo:
         return self.node_id == other.node_id and self.ip == other.ip and self.port == other.port
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class FileMetadata:
     """Metadata about a file in the network"""
     file_hash: str
@@ -40,6 +66,7 @@ class FileMetadata:
     data_chunks: List[str]  # List of chunk hashes
     parity_chunks: List[str]  # List of parity chunk hashes (for FEC)
     peers_with_metadata: Set[str] = field(default_factory=set)  # Node IDs that have this file's metadata
+    chunk_size: Optional[int] = None  # Size of every data chunk but the last (None if unknown)
 
 
 class P2PPeerManager:
@@ -74,25 +101,31 @@ class P2PPeerManager:
         
         # Tracking
         self.known_peers: Dict[str, PeerInfo] = {}  # node_id -> PeerInfo
+        self._sorted_peers: Optional[List[PeerInfo]] = None  # known_peers by chunk count, rebuilt when dirty
+        self._peers_dirty = True
         self.file_metadata: Dict[str, FileMetadata] = {}  # file_hash -> FileMetadata
         self.local_chunks: Set[str] = set()  # Chunks this node has
+        self._peer_cache: Dict[str, Tuple[float, List[PeerInfo]]] = {}  # chunk_hash -> (timestamp, peers)
+        self.cache_ttl = PEER_CACHE_TTL
+        self._inflight: Dict[str, asyncio.Task] = {}  # chunk_hash -> DHT lookup in progress
         
     async def load_local_chunks(self):
-        """Scan storage directory and load list of chunks we have"""
-        self.local_chunks.clear()
-        
-        if not os.path.exists(self.storage_dir):
-            return
+        """
+        Scan storage directory and load list of chunks we have.
         
-        for filename in os.listdir(self.storage_dir):
-            filepath = os.path.join(self.storage_dir, filename)
-            if os.path.isfile(filepath) and filename != "cas_index.json" and filename != "dht_storage.json":
-                self.local_chunks.add(filename)
+        The scan runs in a worker thread so a large directory does not
+        stall the event loop; scandir entries carry their file type, so
+        no per-file stat is needed.
+        """
+        self.local_chunks = await asyncio.to_thread(_scan_chunk_names, self.storage_dir)
     
     async def register_chunks_in_dht(self, chunk_hashes: List[str]):
         """
         Register chunks in DHT so other peers can find them.
         
+        Up to REGISTER_CONCURRENCY stores run at once instead of one
+        round trip after another.
+        
         Args:
             chunk_hashes: List of chunk hashes to register
         """
@@ -101,62 +134,155 @@ class P2PPeerManager:
             "ip": self.local_ip,
             "port": self.local_port
         }
+        semaphore = asyncio.Semaphore(REGISTER_CONCURRENCY)
         
-        for chunk_hash in chunk_hashes:
-            try:
-                await self.dht_node.set(chunk_hash, peer_info)
+        async def register(chunk_hash: str):
+            async with semaphore:
+                return await self.dht_node.set(chunk_hash, peer_info)
+        
+        results = await asyncio.gather(
+            *(register(ch) for ch in chunk_hashes),
+            return_exceptions=True
+        )
+        
+        for chunk_hash, result in zip(chunk_hashes, results):
+            if isinstance(result, Exception):
+                print(f"[ERROR] Failed to register chunk {chunk_hash}: {result}")
+            else:
                 self.local_chunks.add(chunk_hash)
                 print(f"[DHT] Registered chunk: {chunk_hash[:8]}...")
-            except Exception as e:
-                print(f"[ERROR] Failed to register chunk {chunk_hash}: {e}")
     
-    async def find_peers_with_chunk(self, chunk_hash: str) -> List[PeerInfo]:
+    def _cached_peers(self, chunk_hash: str) -> Optional[List[PeerInfo]]:
+        """Return the cached peers for a chunk if still fresh, else None"""
+        cached = self._peer_cache.get(chunk_hash)
+        if cached is None:
+            return None
+        ts, peers = cached
+        if time.monotonic() - ts < self.cache_ttl:
+            return list(peers)
+        del self._peer_cache[chunk_hash]
+        return None
+    
+    async def find_peers_with_chunk(self, chunk_hash: str, bypass_cache: bool = False) -> List[PeerInfo]:
         """
         Find all peers that have a specific chunk using DHT.
         
+        Successful lookups are cached for cache_ttl seconds, and callers
+        asking for a chunk that is already being looked up wait for that
+        lookup instead of starting another.
+        
         Args:
             chunk_hash: Hash of the chunk to find
+            bypass_cache: Query the DHT even if a cached answer is fresh
             
         Returns:
             List of PeerInfo objects that have this chunk
         """
+        if not bypass_cache:
+            cached = self._cached_peers(chunk_hash)
+            if cached is not None:
+                return cached
+        
+        lookup = self._inflight.get(chunk_hash)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._lookup_chunk(chunk_hash))
+            self._inflight[chunk_hash] = lookup
+            lookup.add_done_callback(lambda _: self._inflight.pop(chunk_hash, None))
+        # Shielded so one caller being cancelled doesn't fail the others
+        return list(await asyncio.shield(lookup))
+    
+    async def _lookup_chunk(self, chunk_hash: str) -> List[PeerInfo]:
+        """Query the DHT for a chunk's peers"""
         try:
             result = await self.dht_node.get(chunk_hash)
             if result:
-                peer = PeerInfo(
-                    node_id=result.get("node_id"),
-                    ip=result.get("ip"),
-                    port=result.get("port")
-                )
-                peer.chunks.add(chunk_hash)
-                
-                # Update our peer tracking
-                if peer.node_id not in self.known_peers:
-                    self.known_peers[peer.node_id] = peer
-                else:
-                    self.known_peers[peer.node_id].chunks.add(chunk_hash)
-                
-                return [peer]
+                return self._record_chunk_peer(chunk_hash, result)
             return []
         except Exception as e:
             print(f"[ERROR] DHT lookup failed for chunk {chunk_hash}: {e}")
             return []
     
-    async def find_peers_with_chunks(self, chunk_hashes: List[str]) -> Dict[str, List[PeerInfo]]:
+    def _record_chunk_peer(self, chunk_hash: str, result: dict) -> List[PeerInfo]:
+        """
+        Turn a DHT chunk entry into a PeerInfo, tracking and caching it.
+        A peer we already know at the same address is reused rather than
+        allocating a new PeerInfo.
+        """
+        node_id = result.get("node_id")
+        ip = result.get("ip")
+        port = result.get("port")
+        peer = self.known_peers.get(node_id)
+        if peer is not None and peer.ip == ip and peer.port == port:
+            peer.last_seen = time.time()
+        else:
+            peer = PeerInfo(node_id=node_id, ip=ip, port=port)
+            self.known_peers[node_id] = peer
+        peer.chunks.add(chunk_hash)
+        self._peers_dirty = True
+        
+        self._peer_cache[chunk_hash] = (time.monotonic(), [peer])
+        return [peer]
+    
+    def invalidate_peer_cache(self, chunk_hash: Optional[str] = None) -> None:
+        """Drop the cached peers for one chunk, or the whole cache"""
+        if chunk_hash is None:
+            self._peer_cache.clear()
+        else:
+            self._peer_cache.pop(chunk_hash, None)
+    
+    async def find_peers_with_chunks(
+        self,
+        chunk_hashes: List[str],
+        bypass_cache: bool = False
+    ) -> Dict[str, List[PeerInfo]]:
         """
         Find peers for multiple chunks in parallel.
         
+        Uncached chunks are first fetched with batched FIND_VALUES requests
+        (one per DHT node); only the chunks those miss fall back to a full
+        lookup each. At most CHUNK_LOOKUP_CONCURRENCY of those run at once,
+        so a file with thousands of chunks doesn't flood the DHT. Repeated
+        hashes are looked up once, and chunks another call is already looking
+        up join that lookup.
+        
         Args:
             chunk_hashes: List of chunk hashes to find
+            bypass_cache: Query the DHT even for chunks with fresh cached peers
             
         Returns:
             Dictionary mapping chunk_hash -> List[PeerInfo]
         """
-        tasks = [self.find_peers_with_chunk(ch) for ch in chunk_hashes]
+        chunk_to_peers = {}
+        chunk_hashes = list(dict.fromkeys(chunk_hashes))
+        
+        uncached = []
+        for chunk_hash in chunk_hashes:
+            cached = None if bypass_cache else self._cached_peers(chunk_hash)
+            if cached is not None:
+                chunk_to_peers[chunk_hash] = cached
+            elif chunk_hash not in self._inflight:
+                uncached.append(chunk_hash)
+        if uncached:
+            try:
+                found = await self.dht_node.get_many(uncached)
+            except Exception as e:
+                print(f"[ERROR] Batched DHT lookup failed: {e}")
+                found = {}
+            for chunk_hash, result in found.items():
+                if result:
+                    chunk_to_peers[chunk_hash] = self._record_chunk_peer(chunk_hash, result)
+        
+        remaining = [ch for ch in chunk_hashes if ch not in chunk_to_peers]
+        semaphore = asyncio.Semaphore(CHUNK_LOOKUP_CONCURRENCY)
+        
+        async def bounded_lookup(chunk_hash: str) -> List[PeerInfo]:
+            async with semaphore:
+                return await self.find_peers_with_chunk(chunk_hash, bypass_cache)
+        
+        tasks = [bounded_lookup(ch) for ch in remaining]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
-        chunk_to_peers = {}
-        for chunk_hash, result in zip(chunk_hashes, results):
+        for chunk_hash, result in zip(remaining, results):
             if isinstance(result, Exception):
                 chunk_to_peers[chunk_hash] = []
             else:
@@ -164,13 +290,16 @@ class P2PPeerManager:
         
         return chunk_to_peers
     
-    async def publish_file_metadata(self, file_metadata: FileMetadata):
+    async def publish_file_metadata(self, file_metadata: FileMetadata) -> bool:
         """
         Publish file metadata to DHT so other peers can discover files.
         Creates a "files" DHT key that maps to available files.
         
         Args:
             file_metadata: FileMetadata object to publish
+            
+        Returns:
+            True if the metadata was stored on at least one node
         """
         try:
             # Store file metadata under a special key
@@ -181,15 +310,18 @@ class P2PPeerManager:
                 "size": file_metadata.size,
                 "data_chunks": file_metadata.data_chunks,
                 "parity_chunks": file_metadata.parity_chunks,
+                "chunk_size": file_metadata.chunk_size,
                 "published_by": self.local_node_id,
                 "ip": self.local_ip,
                 "port": self.local_port
             }
             
-            await self.dht_node.set(metadata_key, metadata_dict)
+            stored = await self.dht_node.set(metadata_key, metadata_dict)
             print(f"[DHT] Published file metadata: {file_metadata.original_name}")
+            return stored
         except Exception as e:
             print(f"[ERROR] Failed to publish file metadata: {e}")
+            return False
     
     async def discover_file(self, file_hash: str) -> Optional[FileMetadata]:
         """
@@ -211,7 +343,8 @@ class P2PPeerManager:
                     original_name=result.get("original_name"),
                     size=result.get("size"),
                     data_chunks=result.get("data_chunks", []),
-                    parity_chunks=result.get("parity_chunks", [])
+                    parity_chunks=result.get("parity_chunks", []),
+                    chunk_size=result.get("chunk_size")
                 )
                 self.file_metadata[file_hash] = file_meta
                 return file_meta
@@ -241,8 +374,28 @@ class P2PPeerManager:
             self.known_peers[peer.node_id] = peer
         else:
             self.known_peers[peer.node_id].chunks.update(peer.chunks)
+        self._peers_dirty = True
     
-    def get_peers_with_capacity(self, min_chunks: int = 0) -> List[PeerInfo]:
-        """Get list of peers sorted by number of chunks they have"""
-        peers = list(self.known_peers.values())
-        return sorted(peers, key=lambda p: len(p.chunks), reverse=True)
+    def get_peers_with_capacity(self, min_chunks: int = 0, limit: Optional[int] = None) -> List[PeerInfo]:
+        """
+        Get list of peers sorted by number of chunks they have.
+        
+        The full sort is cached until add_peer or a DHT lookup changes the
+        known peers; code that edits a PeerInfo's chunks directly should
+        go through add_peer so the cache is refreshed.
+        
+        Args:
+            min_chunks: Leave out peers with fewer chunks than this
+            limit: Return at most this many peers (the ones with the most chunks)
+        """
+        if limit is not None and self._peers_dirty:
+            # Top-k without sorting everything
+            peers = heapq.nlargest(limit, self.known_peers.values(), key=lambda p: len(p.chunks))
+        else:
+            if self._peers_dirty or self._sorted_peers is None:
+                self._sorted_peers = sorted(
+                    self.known_peers.values(), key=lambda p: len(p.chunks), reverse=True
+                )
+                self._peers_dirty = False
+            peers = self._sorted_peers if limit is None else self._sorted_peers[:limit]
+        return [p for p in peers if len(p.chunks) >= min_chunks]
@@ -1,147 +1,419 @@
 #!/usr/bin/env python3
-import socket
 import threading
+import queue
 import sys
 import json
 import os
+import socket
+from collections import OrderedDict
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import serialization
 from src.network.dh_utils import (
-    generate_dh_parameters, generate_private_key, generate_shared_key )
+    get_dh_parameters, generate_private_key, generate_shared_key )
+from src.network.frame_utils import (
+    FRAME_HEADER, OP_DATA, OP_TEXT, encode_frame, encode_json_frame, read_frame,
+    encode_key_block, read_key_block )
 import asyncio
 from src.dht.kademlia import KademliaNode
 
-# Global list to keep track of all connected clients
-clients = []
-clients_lock = threading.Lock()
+# Connected clients, addr -> writer; only touched on the event loop thread
+clients = {}
+# Broadcasts skip a client whose unsent output already exceeds this
+BROADCAST_BUFFER_LIMIT = 1024 * 1024
 DHT_NODE=None
+# Event loop running the server and the DHT (on a background thread)
+LOOP=None
+
+# DH group and its DER encoding (length-prefixed) are the same for every client
+DH_PARAMS = get_dh_parameters()
+PARAMS_BYTES = encode_key_block(DH_PARAMS.parameter_bytes(
+    encoding=serialization.Encoding.DER,
+    format=serialization.ParameterFormat.PKCS3
+))
+# Ephemeral (private_key, public_key_bytes) pairs generated ahead of time
+KEY_POOL_SIZE = 32
+_key_pool = queue.Queue(maxsize=KEY_POOL_SIZE)
+
+def new_keypair():
+    """Generate a DH private key and its public key as a DER key block"""
+    private_key = generate_private_key(DH_PARAMS)
+    public_bytes = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_key, encode_key_block(public_bytes)
+
+def fill_key_pool():
+    """Keep the key pool topped up (runs on a daemon thread)"""
+    while True:
+        _key_pool.put(new_keypair())
+
+# Handshake math (key generation, shared-secret exchange) runs here, one
+# worker per core, apart from the loop's default executor
+DH_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="dh")
+
+async def take_keypair():
+    """Pop a pre-generated key pair, or make one off the loop if the pool has run dry"""
+    try:
+        return _key_pool.get_nowait()
+    except queue.Empty:
+        return await asyncio.get_running_loop().run_in_executor(DH_EXECUTOR, new_keypair)
+
+def derive_shared_key(private_key, client_pub_bytes):
+    """Load the client's DER public key and run the DH exchange"""
+    client_public_key = serialization.load_der_public_key(client_pub_bytes)
+    return generate_shared_key(private_key, client_public_key)
+
+STORAGE_DIR = os.path.abspath(os.path.join(
+    os.path.dirname(__file__),
+    "..", "..", "storage", "hashed_files"
+))
+INDEX_PATH = os.path.join(STORAGE_DIR, "cas_index.json")
+
+# Parsed cas_index.json, reused until the file's mtime or size changes,
+# plus replies rendered from it ("list_frame", "files_text"), dropped on reload
+_INDEX_CACHE = {"stamp": None, "data": {}, "list_frame": None, "files_text": None}
+_index_lock = threading.Lock()
+
+def _refresh_index():
+    """Re-read the index if it changed on disk (caller holds _index_lock)"""
+    try:
+        st = os.stat(INDEX_PATH)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stamp = None
+    if stamp != _INDEX_CACHE["stamp"]:
+        if stamp is None:
+            data = {}
+        else:
+            with open(INDEX_PATH, "rb") as f:
+                data = json.loads(f.read())
+        _INDEX_CACHE.update(stamp=stamp, data=data, list_frame=None, files_text=None)
+
+def load_index():
+    """Return the parsed CAS index ({} if there is none), re-reading it only when it changes"""
+    with _index_lock:
+        _refresh_index()
+        return _INDEX_CACHE["data"]
+
+def file_list_frame():
+    """Encoded FILE_LIST reply for the current index, rebuilt only when the index changes"""
+    with _index_lock:
+        _refresh_index()
+        if _INDEX_CACHE["list_frame"] is None:
+            files = [
+                {"name": meta["original_name"], "hash": h, "size": meta["size"]}
+                for h, meta in _INDEX_CACHE["data"].items()
+            ]
+            _INDEX_CACHE["list_frame"] = encode_json_frame(
+                {"type": "FILE_LIST", "files": files}, compress=True
+            )
+        return _INDEX_CACHE["list_frame"]
+
+def files_text():
+    """The console's 'files' listing for the current index ("" if empty), rebuilt only when it changes"""
+    with _index_lock:
+        _refresh_index()
+        if _INDEX_CACHE["files_text"] is None:
+            _INDEX_CACHE["files_text"] = "\n".join(
+                f"- {meta.get('original_name', 'unknown')} | hash={h[:8]}... | size={meta.get('size', 'N/A')}"
+                for h, meta in _INDEX_CACHE["data"].items()
+            )
+        return _INDEX_CACHE["files_text"]
+
+# Control replies that never change
+FILE_END_FRAME = encode_json_frame({"type": "FILE_END"})
+ERROR_FRAME = encode_json_frame({"type": "ERROR"})
+
+# Optional fixed socket buffer size for bulk GET_FILE transfers, set on the
+# listening socket before listen() so accepted connections inherit it.
+# None leaves the kernel's buffer autotuning on; a fixed size turns it off
+# and is capped at net.core.wmem_max/rmem_max
+SOCKET_BUFSIZE = None
+
+def tune_listener(srv):
+    """Apply SOCKET_BUFSIZE, if set, to a not-yet-serving asyncio server's sockets"""
+    if not SOCKET_BUFSIZE:
+        return
+    for sock in srv.sockets:
+        for option, name in ((socket.SO_SNDBUF, "SO_SNDBUF"), (socket.SO_RCVBUF, "SO_RCVBUF")):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFSIZE)
+                granted = sock.getsockopt(socket.SOL_SOCKET, option)
+            except OSError as e:
+                print(f"[WARN] Socket tuning failed: {e}")
+                continue
+            # Linux reports twice the usable size, so less than asked for
+            # means the kernel capped it
+            level = "WARN" if granted < SOCKET_BUFSIZE else "INFO"
+            print(f"[{level}] {name}: asked for {SOCKET_BUFSIZE}, got {granted}")
+
+def set_cork(writer, on):
+    """Toggle TCP_CORK (Linux) so frame headers and sendfile bodies leave in full segments"""
+    # asyncio already sets TCP_NODELAY on every connection, so uncorking
+    # flushes whatever is left straight away
+    if not hasattr(socket, "TCP_CORK"):
+        return
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if on else 0)
+        except OSError:
+            pass
+
+# Chunks up to this size are read on the loop and sent inline with their
+# frame header; a sendfile call costs more than copying a few KiB
+INLINE_CHUNK_SIZE = 16 * 1024
+# Without os.sendfile (e.g. Windows) loop.sendfile falls back to reading the
+# file in an executor one block at a time; reading each larger chunk in one
+# call on IO_EXECUTOR and writing it with its frame is cheaper there
+HAVE_SENDFILE = hasattr(os, "sendfile")
+# Disk reads that are too big to do on the event loop; kept apart from
+# DH_EXECUTOR so handshakes never queue behind file I/O
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+# Inline data is written out once this much has built up
+PENDING_FLUSH_SIZE = 256 * 1024
+
+# Open chunk files, chunk_hash -> {"file", "size", "holders", "cached"},
+# least recently used first; only touched on the event loop thread
+CHUNK_FILE_CACHE_SIZE = 128
+_chunk_files = OrderedDict()
+
+def open_chunk(chunk_hash):
+    """
+    Lease the open file for a stored chunk, or return None if it is missing.
+
+    Files stay open in a small LRU so hot chunks skip the open/close on
+    every GET_FILE; sharing one between clients is safe since sendfile
+    reads at an explicit offset and chunks never change. Also asks the
+    kernel to start reading the chunk in now, so the disk read overlaps
+    with sending the chunk before it. Every lease must be handed back
+    with release_chunk.
+    """
+    cached = _chunk_files.get(chunk_hash)
+    if cached is not None:
+        _chunk_files.move_to_end(chunk_hash)
+    else:
+        try:
+            f = open(os.path.join(STORAGE_DIR, chunk_hash), "rb")
+        except FileNotFoundError:
+            return None
+        cached = _chunk_files[chunk_hash] = {
+            "file": f, "size": os.fstat(f.fileno()).st_size, "holders": 0, "cached": True
+        }
+        if len(_chunk_files) > CHUNK_FILE_CACHE_SIZE:
+            # A client may still be sending from the evicted file; if so the
+            # last one to release it closes it
+            _, evicted = _chunk_files.popitem(last=False)
+            evicted["cached"] = False
+            if not evicted["holders"]:
+                evicted["file"].close()
+    cached["holders"] += 1
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(cached["file"].fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+    return cached
+
+def release_chunk(chunk):
+    """Hand back a lease from open_chunk, closing the file if it was evicted"""
+    if chunk is None:
+        return
+    chunk["holders"] -= 1
+    if not chunk["holders"] and not chunk["cached"]:
+        chunk["file"].close()
+
+def close_chunk_files():
+    """Close every cached chunk file; ones still being sent close on release"""
+    for chunk in _chunk_files.values():
+        chunk["cached"] = False
+        if not chunk["holders"]:
+            chunk["file"].close()
+    _chunk_files.clear()
+
+# Console commands give up on a DHT operation after this many seconds
+COMMAND_TIMEOUT = 30
+
+_seek_lock = threading.Lock()
+
+def read_chunk(f, size):
+    """Read a whole chunk from a (possibly shared) open chunk file"""
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, 0)
+    # Reads also run on IO_EXECUTOR, so keep other threads from moving the
+    # offset between the seek and the read
+    with _seek_lock:
+        f.seek(0)
+        return f.read(size)
+
+def run_on_loop(coro, timeout=None):
+    """Run a coroutine on the server's event loop from another thread and wait for it"""
+    future = asyncio.run_coroutine_threadsafe(coro, LOOP)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"timed out after {timeout}s") from None
+
+# Max DHT stores in flight while registering a stored file's chunks
+REGISTER_CONCURRENCY = 20
+
+async def register_chunks(chunks, peer_info):
+    """
+    Store peer_info under every distinct chunk hash in the DHT, concurrently.
+    Returns (stored, attempted); repeated chunks are registered once.
+    """
+    semaphore = asyncio.Semaphore(REGISTER_CONCURRENCY)
+
+    async def register(chunk_hash):
+        async with semaphore:
+            return await DHT_NODE.set(chunk_hash, peer_info)
+
+    unique = dict.fromkeys(chunks)
+    results = await asyncio.gather(
+        *(register(h) for h in unique), return_exceptions=True
+    )
+    return sum(1 for r in results if r is True), len(unique)
 
 def broadcast_message(message, sender_addr):
-    """Send message to all connected clients except the sender"""
-    with clients_lock:
-        for client_conn, client_addr in clients:
-            if client_addr != sender_addr:
-                try:
-                    client_conn.send(message.encode())
-                except Exception as e:
-                    print(f"[ERROR] Failed to send to {client_addr}: {e}")
+    """Send message to all connected clients except the sender (event loop thread only)"""
+    frame = encode_frame(OP_TEXT, message.encode())
+    for client_addr, client_writer in clients.items():
+        if client_addr == sender_addr:
+            continue
+        # write() never blocks; a peer that stopped reading would just grow
+        # its buffer, so drop messages for it instead
+        if client_writer.transport.get_write_buffer_size() > BROADCAST_BUFFER_LIMIT:
+            print(f"[WARN] Skipping broadcast to slow client {client_addr}")
+            continue
+        try:
+            client_writer.write(frame)
+        except Exception as e:
+            print(f"[ERROR] Failed to send to {client_addr}: {e}")
 
 
-def handle_client(conn, addr):
+async def handle_client(reader, writer):
+    addr = writer.get_extra_info("peername")
     print(f"[INFO] Client {addr} connected")
 
 # Diffie hellman handshake (server side)
-    from cryptography.hazmat.primitives import serialization
     # send parameters to client
-    DH_PARAMS = generate_dh_parameters()
-    params_bytes = DH_PARAMS.parameter_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.ParameterFormat.PKCS3
-    )
-    conn.sendall(params_bytes)
-    server_private_key = generate_private_key(DH_PARAMS)
-    server_public_key = server_private_key.public_key()
+    writer.write(PARAMS_BYTES)
+    await writer.drain()
+    server_private_key, server_pub_bytes = await take_keypair()
     # receive client's public key
-    client_pub_bytes = conn.recv(1024)
-    client_public_key = serialization.load_pem_public_key(client_pub_bytes)
+    client_pub_bytes = await read_key_block(reader)
     # send server's public key
-    server_pub_bytes = server_public_key.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    writer.write(server_pub_bytes)
+    await writer.drain()
+    # the modexp runs on a worker thread so other clients aren't held up
+    shared_key = await asyncio.get_running_loop().run_in_executor(
+        DH_EXECUTOR, derive_shared_key, server_private_key, client_pub_bytes
     )
-    conn.sendall(server_pub_bytes)
-    shared_key = generate_shared_key(server_private_key, client_public_key)
     print(f"[SECURITY] Diffie Hellman handshake completed on SERVER")
-    with clients_lock:
-        clients.append((conn, addr))
+    clients[addr] = writer
 
     try:
         while True:
-            msg = conn.recv(1024)
-            if not msg:
+            try:
+                _, msg = await read_frame(reader)
+            except asyncio.IncompleteReadError:
                 print(f"[INFO] Client {addr} disconnected")
                 break
 
             try:
-                data = json.loads(msg.decode())
-            except json.JSONDecodeError:
+                # json.loads takes the UTF-8 bytes directly; ValueError
+                # covers both bad JSON and bad UTF-8
+                data = json.loads(msg)
+            except ValueError:
                 continue
 
             # ============ LIST FILES ============
             if data.get("type") == "LIST_FILES":
-                index_path = os.path.join(
-                    os.path.dirname(__file__),
-                    "..", "..", "storage", "hashed_files",
-                    "cas_index.json"
-                )
-
-                files = []
-                if os.path.exists(index_path):
-                    with open(index_path, "r") as f:
-                        index = json.load(f)
-
-                    for h, meta in index.items():
-                        files.append({
-                            "name": meta["original_name"],
-                            "hash": h,
-                            "size": meta["size"]
-                        })
-
-                conn.sendall((json.dumps({
-                    "type": "FILE_LIST",
-                    "files": files
-                }) + "\n").encode())
+                writer.write(file_list_frame())
+                await writer.drain()
 
             # ============ GET FILE ============
             elif data.get("type") == "GET_FILE":
                 file_hash = data.get("hash")
-
-                storage_dir = os.path.join(
-                    os.path.dirname(__file__),
-                    "..", "..", "storage", "hashed_files"
-                )
-                index_path = os.path.join(storage_dir, "cas_index.json")
-
-                if not os.path.exists(index_path):
-                    conn.sendall(json.dumps({"type": "ERROR"}).encode())
-                    continue
-
-                with open(index_path, "r") as f:
-                    index = json.load(f)
+                index = load_index()
 
                 if file_hash not in index:
-                    conn.sendall(json.dumps({"type": "ERROR"}).encode())
+                    writer.write(ERROR_FRAME)
+                    await writer.drain()
                     continue
 
                 meta = index[file_hash]
 
                 # ---- FILE START ----
-                conn.sendall(
-                    (json.dumps({
-                        "type": "FILE_START",
-                        "name": meta["original_name"],
-                        "size": meta["size"]
-                    }) + "\n").encode()
-                )
+                # Control frames are held back and go out in one write
+                # with the next DATA header (or FILE_END)
+                pending = [encode_json_frame({
+                    "type": "FILE_START",
+                    "name": meta["original_name"],
+                    "size": meta["size"]
+                })]
+                pending_size = 0
 
                 print(f"[INFO] Sending {meta['original_name']} to {addr}")
 
                 # ---- SEND FILE DATA (DATA CHUNKS ONLY) ----
-                for chunk_hash in meta["data_chunks"]:
-                    chunk_path = os.path.join(storage_dir, chunk_hash)
-
-                    if not os.path.exists(chunk_path):
-                        continue
-
-                    with open(chunk_path, "rb") as cf:
-                        while True:
-                            data_bytes = cf.read(4096)
-                            if not data_bytes:
-                                break
-                            conn.sendall(data_bytes)
-
-                # ---- FILE END (🔥 THIS WAS MISSING 🔥) ----
-                conn.sendall((json.dumps({
-                    "type": "FILE_END"
-                }) + "\n").encode())
+                # Corked for the whole file so the kernel packs headers and
+                # chunk bodies together instead of sending each on its own
+                set_cork(writer, True)
+                data_chunks = meta["data_chunks"]
+                upcoming = open_chunk(data_chunks[0]) if data_chunks else None
+                current = None
+                try:
+                    for i in range(len(data_chunks)):
+                        release_chunk(current)
+                        current, upcoming = upcoming, None
+                        # Open the next chunk first so its read-ahead runs
+                        # while this one is being sent
+                        upcoming = open_chunk(data_chunks[i + 1]) if i + 1 < len(data_chunks) else None
+
+                        if current is None:
+                            continue
+
+                        # One DATA frame per chunk: header from us, body straight
+                        # from the page cache via sendfile (zero-copy where supported)
+                        cf, chunk_size = current["file"], current["size"]
+                        pending.append(FRAME_HEADER.pack(chunk_size + 1, OP_DATA))
+                        if chunk_size <= INLINE_CHUNK_SIZE or not HAVE_SENDFILE:
+                            # Batch the chunk's bytes with the frames around it;
+                            # only small chunks are read on the loop itself
+                            if chunk_size <= INLINE_CHUNK_SIZE:
+                                pending.append(read_chunk(cf, chunk_size))
+                            else:
+                                pending.append(await asyncio.get_running_loop().run_in_executor(
+                                    IO_EXECUTOR, read_chunk, cf, chunk_size
+                                ))
+                            pending_size += chunk_size
+                            if pending_size >= PENDING_FLUSH_SIZE:
+                                writer.writelines(pending)
+                                pending = []
+                                pending_size = 0
+                                await writer.drain()
+                            continue
+                        writer.writelines(pending)
+                        pending = []
+                        pending_size = 0
+                        await writer.drain()
+                        if chunk_size:
+                            await asyncio.get_running_loop().sendfile(
+                                writer.transport, cf, 0, chunk_size
+                            )
+
+                    # ---- FILE END (🔥 THIS WAS MISSING 🔥) ----
+                    pending.append(FILE_END_FRAME)
+                    writer.writelines(pending)
+                    await writer.drain()
+                finally:
+                    release_chunk(current)
+                    release_chunk(upcoming)
+                    set_cork(writer, False)
 
                 print(f"[INFO] File sent successfully to {addr}")
 
@@ -149,186 +421,140 @@ def handle_client(conn, addr):
         print(f"[ERROR] Client {addr}: {e}")
 
     finally:
-        with clients_lock:
-            if (conn, addr) in clients:
-                clients.remove((conn, addr))
-        conn.close()
+        clients.pop(addr, None)
+        writer.close()
         print(f"[INFO] Client {addr} removed. Active clients: {len(clients)}")
 
 
 
-def accept_clients(srv):
-    """Continuously accept new client connections"""
-    while True:
-        try:
-            conn, addr = srv.accept()
-            # Start a new thread for each client
-            client_thread = threading.Thread(
-                target=handle_client, args=(conn, addr), daemon=True
-            )
-            client_thread.start()
-        except Exception as e:
-            print(f"[ERROR] Accepting client: {e}")
-            break
+def _cmd_dht(arg):
+    if DHT_NODE is None:
+        print("[DHT] Not initialized")
+    else:
+        print(DHT_NODE.debug_status())
 
+def _cmd_files(arg):
+    listing = files_text()
 
-def server_input():
-    """Handle server-side input to broadcast messages"""
-    while True:
-        try:
-            msg = input().strip()
-            parts = msg.split(maxsplit=1)
-            cmd = parts[0]
-            arg = parts[1] if len(parts) > 1 else None
-            # ---- COMMAND ROUTER ----
-            if cmd == "dht":
-                if DHT_NODE is None:
-                    print("[DHT] Not initialized")
-                else:
-                    print(DHT_NODE.debug_status())
-                continue
+    if not listing:
+        print("[FILES] No files stored")
+        return
 
-            if cmd == "files":
-                index_path = os.path.join(
-                    os.path.dirname(__file__),
-                    "..", "..", "storage", "hashed_files",
-                    "cas_index.json"
-                )
-
-                if not os.path.exists(index_path):
-                    print("[FILES] No files stored")
-                    continue
-
-                with open(index_path, "r") as f:
-                    index = json.load(f)
-
-                if not index:
-                    print("[FILES] No files stored")
-                    continue
-
-                print("[FILES] Stored files:")
-                for file_hash, meta in index.items():
-                    name = meta.get("original_name", "unknown")
-                    size = meta.get("size", "N/A")
-                    print(f"- {name} | hash={file_hash[:8]}... | size={size}")
-
-                continue
+    print("[FILES] Stored files:")
+    print(listing)
 
+def _cmd_peers(arg):
+    if DHT_NODE is None:
+        print("[PEERS] DHT not initialized")
+        return
 
-            if cmd == "peers":
-                if DHT_NODE is None:
-                    print("[PEERS] DHT not initialized")
-                    continue
+    nodes = DHT_NODE.routing_table.get_all_nodes()
 
-                nodes = DHT_NODE.routing_table.get_all_nodes()
+    if not nodes:
+        print("[PEERS] No peers known")
+    else:
+        print("[PEERS] Known DHT peers:")
+        for n in nodes:
+            print(f"- {n.node_id.hex()} @ {n.ip}:{n.port}")
 
-                if not nodes:
-                    print("[PEERS] No peers known")
-                else:
-                    print("[PEERS] Known DHT peers:")
-                    for n in nodes:
-                        print(f"- {n.node_id.hex()} @ {n.ip}:{n.port}")
+def _cmd_store(arg):
+    if not arg:
+        print("[STORE] Usage: store <file_path>")
+        return
 
-                continue
+    if not os.path.exists(arg):
+        print(f"[STORE] File not found: {arg}")
+        return
 
+    print(f"[STORE] Storing file: {arg}")
 
-            if cmd == "store":
-                if not arg:
-                    print("[STORE] Usage: store <file_path>")
-                    continue
+    # 1️⃣ Store file using CAS
+    from src.cas.cas import store_file_entry
 
-                if not os.path.exists(arg):
-                    print(f"[STORE] File not found: {arg}")
-                    continue
-
-                print(f"[STORE] Storing file: {arg}")
-
-                # 1️⃣ Store file using CAS
-                from src.cas.cas import store_file
-
-                try:
-                    file_hash = store_file(
-                        arg,
-                        os.path.join(
-                            os.path.dirname(__file__),
-                            "..", "..", "storage", "hashed_files"
-                        )
-                    )
-                except Exception as e:
-                    print(f"[STORE] Failed to store file: {e}")
-                    continue
+    try:
+        # 2️⃣ The index entry comes back with the hash, so the index
+        # doesn't have to be re-read just to find the chunks
+        file_hash, meta = store_file_entry(arg, STORAGE_DIR)
+    except Exception as e:
+        print(f"[STORE] Failed to store file: {e}")
+        return
 
-                print(f"[STORE] File stored with hash: {file_hash}")
+    print(f"[STORE] File stored with hash: {file_hash}")
 
-                # 2️⃣ Load CAS index
-                index_path = os.path.join(
-                    os.path.dirname(__file__),
-                    "..", "..", "storage", "hashed_files",
-                    "cas_index.json"
-                )
+    chunks = meta.get("data_chunks", [])+meta.get("parity_chunks",[])
 
-                with open(index_path, "r") as f:
-                    index = json.load(f)
+    print(f"[STORE] Registering {len(chunks)} chunks in DHT")
 
-                meta = index[file_hash]
-                chunks = meta.get("data_chunks", [])+meta.get("parity_chunks",[])
+    # 3️⃣ Register each chunk in DHT
+    peer_info = {
+        "node_id": DHT_NODE.local_node.node_id.hex(),
+        "ip": "127.0.0.1",
+        "port": 9000
+    }
 
-                print(f"[STORE] Registering {len(chunks)} chunks in DHT")
+    # One trip to the loop for all chunks; the stores overlap
+    try:
+        stored, attempted = run_on_loop(register_chunks(chunks, peer_info), COMMAND_TIMEOUT)
+    except TimeoutError as e:
+        print(f"[STORE] DHT registration {e}")
+        return
 
-                # 3️⃣ Register each chunk in DHT
-                peer_info = {
-                    "node_id": DHT_NODE.local_node.node_id.hex(),
-                    "ip": "127.0.0.1",
-                    "port": 9000
-                }
+    print(f"[STORE] File registered in DHT ({stored}/{attempted} chunks stored)")
 
-                for chunk_hash in chunks:
-                    asyncio.get_event_loop().run_until_complete(
-                        DHT_NODE.set(chunk_hash, peer_info)
-                    )
+def _cmd_lookup(arg):
+    if not arg:
+        print("[LOOKUP] Usage: lookup <chunk_hash>")
+        return
 
-                print("[STORE] File registered in DHT")
-                continue
-            if cmd == "lookup":
-                if not arg:
-                    print("[LOOKUP] Usage: lookup <chunk_hash>")
-                    continue
+    print(f"[LOOKUP] Searching DHT for chunk: {arg}")
 
-                print(f"[LOOKUP] Searching DHT for chunk: {arg}")
-
-                try:
-                    result = asyncio.get_event_loop().run_until_complete(
-                        DHT_NODE.get(arg)
-                    )
-                except Exception as e:
-                    print(f"[LOOKUP] DHT error: {e}")
-                    continue
-
-                if not result:
-                    print("[LOOKUP] No node found for this chunk")
-                else:
-                    print("[LOOKUP RESULT]")
-                    print(f"- node_id : {result.get('node_id')}")
-                    print(f"- ip      : {result.get('ip')}")
-                    print(f"- port    : {result.get('port')}")
+    try:
+        result = run_on_loop(DHT_NODE.get(arg), COMMAND_TIMEOUT)
+    except Exception as e:
+        print(f"[LOOKUP] DHT error: {e}")
+        return
+
+    if not result:
+        print("[LOOKUP] No node found for this chunk")
+    else:
+        print("[LOOKUP RESULT]")
+        print(f"- node_id : {result.get('node_id')}")
+        print(f"- ip      : {result.get('ip')}")
+        print(f"- port    : {result.get('port')}")
+
+def _cmd_quit(arg):
+    print("[INFO] Server shutting down...")
+    sys.exit(0)
+
+# Console commands; any other input is broadcast to the clients
+COMMANDS = {
+    "dht": _cmd_dht,
+    "files": _cmd_files,
+    "peers": _cmd_peers,
+    "store": _cmd_store,
+    "lookup": _cmd_lookup,
+    "quit": _cmd_quit,
+}
 
+def server_input():
+    """Handle server-side input: run console commands, broadcast anything else"""
+    while True:
+        try:
+            msg = input().strip()
+            # Skip empty messages
+            if not msg:
                 continue
-
-
-            
-
+            parts = msg.split(maxsplit=1)
+            cmd = parts[0]
+            # Command names match exactly; only quit ignores case
             if cmd.lower() == "quit":
-                print("[INFO] Server shutting down...")
-                sys.exit(0)
-            # Skip empty messages
-            if msg.strip():
+                cmd = "quit"
+            handler = COMMANDS.get(cmd)
+            if handler is not None:
+                handler(parts[1] if len(parts) > 1 else None)
+            else:
                 # Broadcast server message to all clients
-                with clients_lock:
-                    for client_conn, client_addr in clients:
-                        try:
-                            client_conn.send(f"{msg}".encode())
-                        except Exception as e:
-                            print(f"[ERROR] Failed to send to {client_addr}: {e}")
+                LOOP.call_soon_threadsafe(broadcast_message, msg, None)
         except EOFError:
             break
         except Exception as e:
@@ -336,38 +562,37 @@ def server_input():
 
 
 def main():
-    global DHT_NODE
+    global DHT_NODE, LOOP
     HOST = "0.0.0.0"
     PORT = 9000
     DHT_PORT=8468
-    # start DHT (simple mode)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    # One event loop, on a background thread, runs the DHT and serves every
+    # client; the main thread reads server commands from stdin
+    LOOP = asyncio.new_event_loop()
+    threading.Thread(target=LOOP.run_forever, daemon=True).start()
+    threading.Thread(target=fill_key_pool, daemon=True).start()
 
+    # start DHT (simple mode)
     DHT_NODE = KademliaNode("127.0.0.1", DHT_PORT)
-    loop.run_until_complete(DHT_NODE.start())
-    loop.run_until_complete(
+    run_on_loop(DHT_NODE.start())
+    run_on_loop(
         DHT_NODE.bootstrap([("127.0.0.1", DHT_PORT)])
     )
 
     print("[DHT] Node started")
 
-    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
+    srv = None
     try:
-        srv.bind((HOST, PORT))
-        srv.listen(5)  # Allow up to 5 pending connections
+        srv = run_on_loop(asyncio.start_server(
+            handle_client, HOST, PORT, reuse_address=True, backlog=128,
+            start_serving=False
+        ))
+        tune_listener(srv)
+        run_on_loop(srv.start_serving())
         print(f"[INFO] Server listening on {HOST}:{PORT}")
         print("[INFO] Waiting for client connections...")
         print("[INFO] Type messages to broadcast to all clients, or 'quit' to exit\n")
 
-        # Start thread to accept clients
-        accept_thread = threading.Thread(
-            target=accept_clients, args=(srv,), daemon=True
-        )
-        accept_thread.start()
-
         # Handle server input in main thread
         server_input()
 
@@ -376,7 +601,10 @@ def main():
     except Exception as e:
         print(f"[ERROR] {e}")
     finally:
-        srv.close()
+        if srv is not None:
+            LOOP.call_soon_threadsafe(srv.close)
+        LOOP.call_soon_threadsafe(close_chunk_files)
+        LOOP.call_soon_threadsafe(LOOP.stop)
 
 
 if __name__ == "__main__":
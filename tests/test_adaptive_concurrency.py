@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import os
+
+from src.network import p2p_chunk_downloader
+from src.network.p2p_chunk_downloader import AdaptiveConcurrencyController, P2PChunkDownloader
+from src.network.p2p_node import P2PNode
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_limit_grows_while_goodput_improves(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(p2p_chunk_downloader.time, "monotonic", clock)
+    controller = AdaptiveConcurrencyController(initial=2, maximum=4, window=1.0)
+
+    controller.record_bytes(0)
+    for nbytes in (1000, 2000, 3000, 4000):
+        clock.now += 1.0
+        controller.record_bytes(nbytes)
+    assert controller.limit == 4  # capped at maximum
+
+    clock.now += 1.0
+    controller.record_bytes(10)  # worse window: no change
+    assert controller.limit == 4
+
+
+def test_limit_halves_on_failure_down_to_minimum():
+    controller = AdaptiveConcurrencyController(initial=16, minimum=2, maximum=16)
+    limits = []
+    for _ in range(4):
+        controller.record_failure()
+        limits.append(controller.limit)
+    assert limits == [8, 4, 2, 2]
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def run():
+        controller = AdaptiveConcurrencyController(initial=1, maximum=1)
+        await controller.acquire()
+        assert controller.locked()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        controller.release()
+        await asyncio.wait_for(waiter, 1)
+        assert controller.locked()
+        controller.release()
+
+    asyncio.run(run())
+
+
+def test_timeouts_shrink_the_limit():
+    async def stall(reader, writer):
+        await reader.read()  # never answer
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(stall, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        controller = AdaptiveConcurrencyController(initial=8, maximum=8)
+        downloader = P2PChunkDownloader("unused", timeout=0.2, controller=controller)
+        try:
+            assert await downloader.download_chunk("ab" * 32, "127.0.0.1", port) is None
+            assert controller.limit == 4
+            await downloader.download_chunk("ab" * 32, "127.0.0.1", port)
+            assert controller.limit == 2
+            assert controller._active == 0
+        finally:
+            await downloader.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def _store_chunks(storage_dir, count=24):
+    chunks = {}
+    for i in range(count):
+        data = os.urandom(4096 + i)
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        (storage_dir / chunk_hash).write_bytes(data)
+        chunks[chunk_hash] = data
+    return chunks
+
+
+async def _download_from_node(storage_dir, chunk_hashes, controller):
+    node = P2PNode("test", "127.0.0.1", 0, 0, str(storage_dir))
+    node.start_server()
+    while node.server is None:
+        await asyncio.sleep(0.01)
+    port = node.server.sockets[0].getsockname()[1]
+    downloader = P2PChunkDownloader(str(storage_dir), controller=controller)
+    try:
+        return await downloader.download_chunks_from_peer(chunk_hashes, "127.0.0.1", port)
+    finally:
+        await downloader.close()
+        await node.shutdown()
+
+
+class PeakController(AdaptiveConcurrencyController):
+    """Remembers the most slots ever held at once."""
+    peak = 0
+
+    async def acquire(self):
+        await super().acquire()
+        self.peak = max(self.peak, self._active)
+
+
+def test_successful_downloads_grow_the_limit(tmp_path):
+    chunks = _store_chunks(tmp_path)
+    controller = AdaptiveConcurrencyController(initial=2, maximum=16, window=0.0)
+    results = asyncio.run(_download_from_node(tmp_path, list(chunks), controller))
+    assert results == chunks
+    assert controller.limit > 2
+    assert controller._active == 0
+
+
+def test_each_pipelined_request_holds_a_slot(tmp_path):
+    chunks = _store_chunks(tmp_path)
+    # A fixed limit below PIPELINE_WINDOW must narrow the pipeline
+    controller = PeakController(initial=2, maximum=2)
+    results = asyncio.run(_download_from_node(tmp_path, list(chunks), controller))
+    assert results == chunks
+    assert controller.peak == 2
+    assert controller._active == 0
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from src.network.p2p_chunk_downloader import P2PChunkDownloader
+from src.network.p2p_node import P2PNode
+
+CHUNK_SIZE = 65536
+
+
+@pytest.fixture
+def stored_file(tmp_path):
+    """A file cut into CAS-style chunks, with its first chunk repeated."""
+    storage_dir = tmp_path / "store"
+    storage_dir.mkdir()
+    first = os.urandom(CHUNK_SIZE)
+    body = first + os.urandom(2 * CHUNK_SIZE) + first + os.urandom(1234)
+    chunk_hashes = []
+    for offset in range(0, len(body), CHUNK_SIZE):
+        chunk = body[offset:offset + CHUNK_SIZE]
+        chunk_hash = hashlib.sha256(chunk).hexdigest()
+        (storage_dir / chunk_hash).write_bytes(chunk)
+        chunk_hashes.append(chunk_hash)
+    assert chunk_hashes[0] == chunk_hashes[3]
+    return storage_dir, body, chunk_hashes
+
+
+def download(storage_dir, chunk_hashes, output_path, file_size, chunk_size=None, peers=True):
+    async def run():
+        node = P2PNode("test", "127.0.0.1", 0, 0, str(storage_dir))
+        node.start_server()
+        while node.server is None:
+            await asyncio.sleep(0.01)
+        peer = ("127.0.0.1", node.server.sockets[0].getsockname()[1])
+        chunk_peers = {ch: [peer] for ch in chunk_hashes} if peers else {}
+        downloader = P2PChunkDownloader(str(output_path.parent))
+        try:
+            return await downloader.download_file_to(
+                chunk_hashes, chunk_peers, str(output_path), file_size, chunk_size
+            )
+        finally:
+            await downloader.close()
+            await node.shutdown()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("chunk_size", [CHUNK_SIZE, None])
+def test_reassembles_the_file(stored_file, tmp_path, chunk_size):
+    storage_dir, body, chunk_hashes = stored_file
+    output = tmp_path / "out.bin"
+    assert download(storage_dir, chunk_hashes, output, len(body), chunk_size)
+    assert output.read_bytes() == body
+
+
+def test_single_chunk_file(stored_file, tmp_path):
+    storage_dir, body, chunk_hashes = stored_file
+    output = tmp_path / "tail.bin"
+    assert download(storage_dir, chunk_hashes[-1:], output, 1234)
+    assert output.read_bytes() == body[-1234:]
+
+
+@pytest.mark.parametrize("size_delta", [1, -1])
+def test_wrong_size_fails_and_removes_the_output(stored_file, tmp_path, size_delta):
+    storage_dir, body, chunk_hashes = stored_file
+    output = tmp_path / "out.bin"
+    assert not download(storage_dir, chunk_hashes, output, len(body) + size_delta)
+    assert not output.exists()
+
+
+def test_missing_chunks_fail_and_remove_the_output(stored_file, tmp_path):
+    storage_dir, body, chunk_hashes = stored_file
+    output = tmp_path / "out.bin"
+    assert not download(storage_dir, chunk_hashes, output, len(body), CHUNK_SIZE, peers=False)
+    assert not output.exists()
@@ -0,0 +1,68 @@
+import asyncio
+import hashlib
+import os
+
+from src.network.frame_utils import CHUNK_OK, CHUNK_REQUEST, CHUNK_RESPONSE
+from src.network.p2p_chunk_downloader import AdaptiveConcurrencyController, P2PChunkDownloader
+
+CHUNK = os.urandom(256 * 1024)
+CHUNK_HASH = hashlib.sha256(CHUNK).hexdigest()
+
+
+def test_cancelled_batch_does_not_leave_a_dirty_pooled_connection():
+    connections = []
+
+    async def serve(reader, writer, half_sent):
+        """First connection stalls halfway through a body; later ones answer in full."""
+        first = not connections
+        connections.append(writer)
+        try:
+            while True:
+                await reader.readexactly(CHUNK_REQUEST.size)
+                writer.write(CHUNK_RESPONSE.pack(CHUNK_OK, len(CHUNK)))
+                if first:
+                    writer.write(CHUNK[:len(CHUNK) // 2])
+                    await writer.drain()
+                    half_sent.set()
+                    await reader.read()  # never finish
+                    return
+                writer.write(CHUNK)
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def run():
+        half_sent = asyncio.Event()
+        server = await asyncio.start_server(
+            lambda reader, writer: serve(reader, writer, half_sent), "127.0.0.1", 0
+        )
+        peer = ("127.0.0.1", server.sockets[0].getsockname()[1])
+        controller = AdaptiveConcurrencyController(initial=8, maximum=8)
+        downloader = P2PChunkDownloader("unused", controller=controller)
+        try:
+            batch = asyncio.ensure_future(
+                downloader.download_chunks_from_peer([CHUNK_HASH] * 3, *peer)
+            )
+            await asyncio.wait_for(half_sent.wait(), 5)
+            await asyncio.sleep(0.05)  # let the client read the partial body
+            batch.cancel()
+            try:
+                await batch
+            except asyncio.CancelledError:
+                pass
+            assert batch.cancelled()
+            assert peer not in downloader._conns
+            assert controller._active == 0
+
+            # The next request dials a fresh connection and reads a proper header
+            assert await downloader.download_chunk(CHUNK_HASH, *peer) == CHUNK
+            assert len(connections) == 2
+            assert controller.limit == 8  # no failure was recorded
+        finally:
+            await downloader.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+import asyncio
+
+from src.network.frame_utils import CHUNK_OK, CHUNK_REQUEST, CHUNK_RESPONSE, MAX_FRAME_SIZE
+from src.network.p2p_chunk_downloader import P2PChunkDownloader
+
+CHUNK_HASH = "ab" * 32
+
+
+def oversized_peer(announced, test):
+    """Run test(downloader, peer) against a peer that announces `announced` bytes and sends none."""
+    async def serve(reader, writer):
+        try:
+            await reader.readexactly(CHUNK_REQUEST.size)
+            writer.write(CHUNK_RESPONSE.pack(CHUNK_OK, announced))
+            await writer.drain()
+            await reader.read()
+        finally:
+            writer.close()
+
+    async def run():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        peer = ("127.0.0.1", server.sockets[0].getsockname()[1])
+        downloader = P2PChunkDownloader("unused", timeout=30)
+        try:
+            # Rejected on the header alone, long before the timeout
+            await asyncio.wait_for(test(downloader, peer), 5)
+            assert peer not in downloader._conns
+        finally:
+            await downloader.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_chunk_size_over_max_frame_size_is_rejected():
+    async def test(downloader, peer):
+        assert await downloader.download_chunk(CHUNK_HASH, *peer) is None
+
+    oversized_peer(MAX_FRAME_SIZE + 1, test)
+
+
+def test_chunk_size_over_the_expected_size_is_rejected():
+    async def test(downloader, peer):
+        results = await downloader.download_chunks_from_peer(
+            [CHUNK_HASH], *peer, max_chunk_size=64 * 1024
+        )
+        assert results == {CHUNK_HASH: None}
+
+    oversized_peer(64 * 1024 + 1, test)
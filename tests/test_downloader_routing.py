@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import os
+
+from src.network.frame_utils import (
+    CHUNK_MISSING,
+    CHUNK_OK,
+    CHUNK_REQUEST,
+    CHUNK_RESPONSE,
+    GET_CHUNK_OPCODE,
+    RANGE_REQUEST,
+    RANGE_RESPONSE,
+)
+from src.network.p2p_chunk_downloader import P2PChunkDownloader
+
+
+class FakePeer:
+    """Serves GET_CHUNK and GET_CHUNK_RANGE from a dict, counting requests."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk_requests = 0
+        self.range_requests = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return ("127.0.0.1", self.server.sockets[0].getsockname()[1])
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                opcode = (await reader.readexactly(1))[0]
+                if opcode == GET_CHUNK_OPCODE:
+                    _, raw = CHUNK_REQUEST.unpack(
+                        bytes([opcode]) + await reader.readexactly(CHUNK_REQUEST.size - 1)
+                    )
+                    self.chunk_requests += 1
+                    data = self.chunks.get(raw.hex())
+                    if data is None:
+                        writer.write(CHUNK_RESPONSE.pack(CHUNK_MISSING, 0))
+                    else:
+                        writer.write(CHUNK_RESPONSE.pack(CHUNK_OK, len(data)) + data)
+                else:
+                    _, raw, offset, length = RANGE_REQUEST.unpack(
+                        bytes([opcode]) + await reader.readexactly(RANGE_REQUEST.size - 1)
+                    )
+                    self.range_requests += 1
+                    data = self.chunks[raw.hex()]
+                    piece = data[offset:offset + length]
+                    writer.write(RANGE_RESPONSE.pack(CHUNK_OK, len(data), len(piece)) + piece)
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+
+def make_chunks(count, size):
+    chunks = [os.urandom(size) for _ in range(count)]
+    return {hashlib.sha256(c).hexdigest(): c for c in chunks}
+
+
+def test_small_shared_chunks_are_balanced_over_pipelined_batches():
+    chunks = make_chunks(16, 64 * 1024)
+
+    async def run():
+        peers = [FakePeer(chunks), FakePeer(chunks)]
+        addrs = [await p.start() for p in peers]
+        downloader = P2PChunkDownloader("unused")
+        try:
+            results = await downloader.download_chunks_parallel(
+                {ch: list(addrs) for ch in chunks}, chunk_size=64 * 1024
+            )
+        finally:
+            await downloader.close()
+            for p in peers:
+                p.server.close()
+        assert results == chunks
+        assert [p.range_requests for p in peers] == [0, 0]
+        assert [p.chunk_requests for p in peers] == [8, 8]
+
+    asyncio.run(run())
+
+
+def test_shared_chunk_failed_by_its_peer_is_retried_elsewhere():
+    chunks = make_chunks(4, 64 * 1024)
+
+    async def run():
+        empty, full = FakePeer({}), FakePeer(chunks)
+        addrs = [await empty.start(), await full.start()]
+        downloader = P2PChunkDownloader("unused")
+        try:
+            results = await downloader.download_chunks_parallel(
+                {ch: list(addrs) for ch in chunks}, chunk_size=64 * 1024
+            )
+        finally:
+            await downloader.close()
+            empty.server.close()
+            full.server.close()
+        assert results == chunks
+        assert empty.chunk_requests == 2
+
+    asyncio.run(run())
+
+
+def test_unknown_size_is_probed_once_before_batching():
+    chunks = make_chunks(8, 64 * 1024)
+
+    async def run():
+        peers = [FakePeer(chunks), FakePeer(chunks)]
+        addrs = [await p.start() for p in peers]
+        downloader = P2PChunkDownloader("unused")
+        try:
+            results = await downloader.download_chunks_parallel(
+                {ch: list(addrs) for ch in chunks}
+            )
+        finally:
+            await downloader.close()
+            for p in peers:
+                p.server.close()
+        assert results == chunks
+        # The probe returns its chunk whole; the other 7 go in batches
+        assert sum(p.range_requests for p in peers) == 1
+        assert sum(p.chunk_requests for p in peers) == 7
+
+    asyncio.run(run())
+
+
+def test_large_shared_chunks_are_swarmed():
+    chunks = make_chunks(2, 2 * 1024 * 1024)
+
+    async def run():
+        peers = [FakePeer(chunks), FakePeer(chunks)]
+        addrs = [await p.start() for p in peers]
+        downloader = P2PChunkDownloader("unused")
+        try:
+            results = await downloader.download_chunks_parallel(
+                {ch: list(addrs) for ch in chunks}, chunk_size=2 * 1024 * 1024
+            )
+        finally:
+            await downloader.close()
+            for p in peers:
+                p.server.close()
+        assert results == chunks
+        assert [p.chunk_requests for p in peers] == [0, 0]
+        assert all(p.range_requests for p in peers)
+
+    asyncio.run(run())
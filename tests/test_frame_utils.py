@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+from src.network.frame_utils import (
+    COMPRESS_MIN_SIZE, FRAME_HEADER, MAX_FRAME_SIZE, OP_DATA, OP_JSON, OP_JSON_ZLIB,
+    OP_TEXT, decode_json_payload, encode_frame, encode_json_frame, encode_key_block,
+    read_frame, read_key_block
+)
+
+
+def reader_for(data, eof=True):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    if eof:
+        reader.feed_eof()
+    return reader
+
+
+def read_all_frames(data):
+    async def run():
+        reader = reader_for(data)
+        frames = []
+        while True:
+            try:
+                frames.append(await read_frame(reader))
+            except asyncio.IncompleteReadError:
+                return frames
+
+    return asyncio.run(run())
+
+
+def test_frames_round_trip():
+    frames = [(OP_TEXT, "héllo".encode()), (OP_DATA, b""), (OP_DATA, bytes(range(256)) * 300)]
+    data = b"".join(encode_frame(opcode, payload) for opcode, payload in frames)
+    assert read_all_frames(data) == frames
+
+
+def test_json_frames_round_trip_with_and_without_compression():
+    small = {"type": "FILE_END"}
+    large = {"type": "FILE_LIST", "files": [{"name": f"file{i}.txt"} for i in range(100)]}
+    data = (
+        encode_json_frame(small, compress=True)
+        + encode_json_frame(large)
+        + encode_json_frame(large, compress=True)
+    )
+    (op1, p1), (op2, p2), (op3, p3) = read_all_frames(data)
+    assert op1 == OP_JSON  # too small to be worth compressing
+    assert op2 == OP_JSON
+    assert op3 == OP_JSON_ZLIB and len(p3) < len(p2)
+    assert len(p2) >= COMPRESS_MIN_SIZE
+    assert decode_json_payload(op1, p1) == small
+    assert decode_json_payload(op2, p2) == large
+    assert decode_json_payload(op3, p3) == large
+    assert json.loads(p2) == large
+
+
+def test_truncated_frame_raises_incomplete_read():
+    frame = encode_frame(OP_TEXT, b"abcdef")
+
+    async def run():
+        await read_frame(reader_for(frame[:-1]))
+
+    with pytest.raises(asyncio.IncompleteReadError):
+        asyncio.run(run())
+
+
+def test_oversized_frame_is_rejected_before_reading_the_body():
+    async def run():
+        # No body follows and no EOF: only the length check can end this read
+        reader = reader_for(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1, OP_DATA), eof=False)
+        await asyncio.wait_for(read_frame(reader), 1)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_key_blocks_round_trip():
+    blocks = [b"\x30\x82" + bytes(300), b""]
+
+    async def run():
+        reader = reader_for(b"".join(encode_key_block(b) for b in blocks))
+        return [await read_key_block(reader) for _ in blocks]
+
+    assert asyncio.run(run()) == blocks
@@ -0,0 +1,93 @@
+import random
+
+from src.dht.node import ID_BYTES, Node, int_to_bytes
+from src.dht.routing_table import KBucket, RoutingTable
+
+
+def make_node(node_int, port=0):
+    return Node(int_to_bytes(node_int), "127.0.0.1", port)
+
+
+def check_index(table):
+    """The flat arrays and the bucket index agree with the buckets."""
+    bucketed = {
+        n.node_id: idx for idx, bucket in enumerate(table.buckets) for n in bucket.get_nodes()
+    }
+    assert set(table._pos) == set(bucketed)
+    for node_id, pos in table._pos.items():
+        assert table._refs[pos].node_id == node_id
+        assert table._id_ints[pos] == table._refs[pos].node_id_int
+    for node_id, idx in table._index.items():
+        if node_id in bucketed:
+            assert bucketed[node_id] == idx
+
+
+def test_bucket_index_follows_highest_differing_bit():
+    table = RoutingTable(make_node(0))
+    assert table.get_bucket_index(int_to_bytes(1)) == 0
+    assert table.get_bucket_index(int_to_bytes(0b101)) == 2
+    assert table.get_bucket_index(int_to_bytes(1 << (ID_BYTES * 8 - 1))) == ID_BYTES * 8 - 1
+
+
+def test_kbucket_orders_by_last_seen_and_reports_oldest_when_full():
+    bucket = KBucket(k=2)
+    a, b, c = make_node(1), make_node(2), make_node(3)
+    assert bucket.add(a) is None
+    assert bucket.add(b) is None
+    assert bucket.touch(a)
+    assert bucket.get_nodes() == [b, a]
+    assert bucket.add(c) is b  # full: oldest goes up for a ping check
+    assert not bucket.contains(c)
+
+    assert bucket.remove(b)
+    assert bucket.get_nodes() == [a, c]  # promoted from the replacement cache
+
+
+def test_add_and_remove_keep_the_index_consistent():
+    rng = random.Random(5)
+    table = RoutingTable(make_node(rng.getrandbits(160)), k=3)
+    nodes = [make_node(rng.getrandbits(160), port=i) for i in range(200)]
+    # Crowd the top bucket so some nodes land in replacement caches
+    nodes += [make_node((table.local_node_int ^ (1 << 159)) ^ i) for i in range(1, 8)]
+    for node in nodes:
+        table.add_node(node)
+    check_index(table)
+    assert table.total_nodes() == len(table.get_all_nodes())
+
+    for node in rng.sample(nodes, 80):
+        table.remove_node(node)
+        check_index(table)
+
+    # Re-adding a known node only refreshes it
+    known = table.get_all_nodes()[0]
+    before = table.total_nodes()
+    assert table.add_node(known) is None
+    assert table.total_nodes() == before
+    check_index(table)
+
+
+def test_closest_nodes_are_sorted_by_xor_distance():
+    rng = random.Random(7)
+    table = RoutingTable(make_node(rng.getrandbits(160)))
+    for i in range(300):
+        table.add_node(make_node(rng.getrandbits(160), port=i))
+    everyone = table.get_all_nodes()
+
+    for _ in range(20):
+        target = rng.getrandbits(160)
+        expected = sorted(everyone, key=lambda n: n.node_id_int ^ target)[:20]
+        assert table.get_closest_nodes_int(target, count=20) == expected
+        assert table.get_closest_nodes(int_to_bytes(target), count=20) == expected
+
+        excluded = expected[0]
+        closest = table.get_closest_nodes_int(target, count=20, exclude_id=excluded.node_id)
+        assert closest == expected[1:] + [
+            sorted(everyone, key=lambda n: n.node_id_int ^ target)[20]
+        ]
+
+
+def test_local_node_is_never_added():
+    local = make_node(42)
+    table = RoutingTable(local)
+    assert table.add_node(make_node(42)) is None
+    assert table.total_nodes() == 0
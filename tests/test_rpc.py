@@ -0,0 +1,24 @@
+from src.dht.node import Node, int_to_bytes
+from src.dht.routing_table import RoutingTable
+from src.dht.rpc import MAX_FIND_VALUES_KEYS, RPCHandler
+
+
+def make_handler(storage):
+    return RPCHandler(RoutingTable(Node(int_to_bytes(0), "127.0.0.1", 0)), storage)
+
+
+def find_values(handler, keys):
+    return handler._handle_find_values(Node(int_to_bytes(1), "127.0.0.1", 1), {"keys": keys})
+
+
+def test_find_values_returns_only_held_keys():
+    handler = make_handler({"aa": {"value": 1}, "bb": {"value": 2}})
+    assert find_values(handler, ["aa", "cc"]) == {"values": {"aa": 1}}
+
+
+def test_find_values_rejects_malformed_keys():
+    handler = make_handler({"aa": {"value": 1}})
+    assert "error" in find_values(handler, "aa")
+    assert "error" in find_values(handler, ["aa", ["bb"]])
+    assert "error" in find_values(handler, ["aa", {"k": "v"}])
+    assert "error" in find_values(handler, ["aa"] * (MAX_FIND_VALUES_KEYS + 1))